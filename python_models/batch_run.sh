@@ -1,44 +1,47 @@
 #!/bin/bash
+# runs the bubble_up lookaside x lookahead sweep for every network in nets.txt
+# runner.py schedules (layer, config) work items on all cores
 
-N_CPU=`cat /proc/cpuinfo | grep processor -c`
+mkdir -p results
 
-((N_CPU--)) # save one "core" for other stuff
+for prec in 8 7
+do
+    outfile="results/bubble_up_${prec}bit.csv"
+    if [ -f $outfile ]; then
+        echo "$outfile exists"
+        continue
+    fi
+    echo "launching filters/csv_${prec}bits"
+    python runner.py -n nets.txt -o $outfile -d results/results.db -b bubble_up_${prec}bit \
+        filters/csv_${prec}bits 0-15 1-5
+done
 
-declare -a jobs=(
-"./run_net.sh vgg19_8bit filters/csv_8bits/VGG19*"
-"./run_net.sh vgg19_7bit filters/csv_7bits/VGG19*"
-"./run_net.sh googlenet_8bit filters/csv_8bits/google*"
-"./run_net.sh googlenet_7bit filters/csv_7bits/google*"
-"./run_net.sh alexnet_7bit filters/csv_7bits/alexnet*"
-"./run_net.sh alexnet_8bit filters/csv_8bits/alexnet*"
-"./run_net.sh cnn_m_7bit filters/csv_7bits/CNN_M*"
-"./run_net.sh cnn_s_7bit filters/csv_7bits/CNN_S*"
-"./run_net.sh flickr_7bit filters/csv_7bits/flickr*"
-"./run_net.sh hybridcnn_7bit filters/csv_7bits/hybrid*"
-"./run_net.sh placescnn_7bit filters/csv_7bits/places*"
-"./run_net.sh rcnn_7bit filters/csv_7bits/rcnn*"
-"./run_net.sh cnn_m_8bit filters/csv_8bits/CNN_M*"
-"./run_net.sh cnn_s_8bit filters/csv_8bits/CNN_S*"
-"./run_net.sh flickr_8bit filters/csv_8bits/flickr*"
-"./run_net.sh hybridcnn_8bit filters/csv_8bits/hybrid*"
-"./run_net.sh placescnn_8bit filters/csv_8bits/places*"
-"./run_net.sh rcnn_8bit filters/csv_8bits/rcnn*"
-)
+# reuse distance histograms of every layer and Tii, also kept in the results
+# store so buffer sizes can be read off with results_db.select_hist
+for prec in 8 7
+do
+    outfile="results/reuse_hist_${prec}bit.csv"
+    if [ -f $outfile ]; then
+        echo "$outfile exists"
+        continue
+    fi
+    echo "launching reuse_hist filters/csv_${prec}bits"
+    python runner.py -n nets.txt -s reuse_hist.py -o $outfile -d results/results.db -b reuse_hist_${prec}bit \
+        filters/csv_${prec}bits 16,32,64,128,256,512,1024
+done
 
-for ((i = 0; i < ${#jobs[@]}; i++))
+# zero rows and the lower bound on rows of every layer and Tii, plotted
+# against the sweep with
+#   plot_row_redux.py results/results.db bubble_up_8bit lookaside lookahead \
+#       total_reduced_rows total_rows row_stats_8bit
+for prec in 8 7
 do
-    echo "launching ${jobs[i]}"
-    ${jobs[i]} &
-    wait_start=1
-    while true; do
-        proc_count=`ps | grep -v grep | grep "run_net.sh" -c`
-        if (( proc_count < N_CPU )); then
-            break
-        fi
-        if [[ $wait_start == 1 ]]; then
-            echo "waiting for free CPU"
-            wait_start=0
-        fi
-        sleep 1s
-    done
+    outfile="results/row_stats_${prec}bit.csv"
+    if [ -f $outfile ]; then
+        echo "$outfile exists"
+        continue
+    fi
+    echo "launching row_stats filters/csv_${prec}bits"
+    python runner.py -n nets.txt -s row_stats.py -o $outfile -d results/results.db -b row_stats_${prec}bit \
+        filters/csv_${prec}bits 16,32,64,128,256,512,1024
 done
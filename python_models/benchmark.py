@@ -0,0 +1,224 @@
+#!/usr/bin/python
+# benchmarks of the weight analysis hot paths
+#   times the hot functions and the end to end scripts on fixed synthetic
+#   layers, appends the times to a JSON history and fails if a benchmark is
+#   slower than its recent runs on this host by more than a threshold
+#
+# usage: benchmark.py [-o history.json] [-t threshold] [-r repeats] [-b name] [-E] [-n]
+#   e.g. benchmark.py -b vgg19_conv5 -r 5
+#
+# each benchmark is named <layer>/<function> and timed as the best of
+# repeats runs. the baseline of a benchmark is the median of its last
+# baseline_runs times recorded on this host
+
+import sys
+import os
+import re
+import time
+import json
+import shutil
+import platform
+import tempfile
+import subprocess
+from optparse import OptionParser
+import numpy as np
+
+import chunk
+import find_dups
+import bubble_up
+import bubble_up_rm_dup
+
+Ti=16
+Tn=16
+Tnn=1024
+Tii=1024
+
+# synthetic layers: (name, Nn, Ni, density, seed)
+#   fixed point codes, laplacian like trained weights, pruned to density
+LAYERS = (
+    ('alexnet_conv2',  256,  1200, 0.35, 1), # 5x5x48 filters
+    ('vgg19_conv5',    512,  4608, 0.30, 2), # 3x3x512 filters
+    ('fc6',           4096,  9216, 0.10, 3), # alexnet fc6
+)
+
+# the python loop engines run on the first model_chunks chunks of a layer
+model_chunks = 2
+
+# the end to end scripts run on the first e2e_shape weights of a layer
+e2e_shape = (64, 1024)
+
+# bubble_up_rm_dup configuration of the benchmarks
+RM_DUP_PARAMS = dict(lookaside=3, lookahead=4, out_limit=4, in_limit=4, group_size=16, out_b=2,
+                     buffer_size=1024, n_sets=1, n_ways=1, Tii=Tii)
+
+# runs used as the baseline of a benchmark
+baseline_runs = 5
+
+# regressions smaller than this (seconds) are timer noise
+min_delta = 0.005
+
+# Nn x Ni int8 weight codes of a synthetic layer, the same on every run
+def make_layer(Nn, Ni, density, seed):
+    rs = np.random.RandomState(seed)
+    codes = np.clip(np.round(rs.laplace(0, 12, (Nn, Ni))), -127, 127).astype(np.int8)
+    codes[rs.rand(Nn, Ni) >= density] = 0
+    return codes
+
+# writes codes as a filter csv, weights = codes / 128
+def write_csv(filename, codes):
+    f = open(filename, 'w')
+    for (n, row) in enumerate(codes):
+        f.write("filter %d\n" % n)
+        f.write(",".join(["%.7f" % (c / 128.0) for c in row]) + ",\n")
+    f.close()
+
+# best time of repeats calls of f
+def best_time(f, repeats):
+    best = None
+    for r in range(repeats):
+        start = time.time()
+        f()
+        t = time.time() - start
+        best = t if best is None else min(best, t)
+    return best
+
+# (name, f) of every benchmark of one layer
+def layer_benchmarks(name, w, csv):
+    (Nn, Ni) = w.shape
+    (masks, rows) = bubble_up.layer_masks(w,Nn,Ni,Tnn,Tii,Tn,Ti)
+    (tiles, chunk_idx, chunk_rows) = chunk.tile(w,Nn,Ni,Tnn,Tii,Tn,Ti)
+    chunks = [ (tiles[c,:chunk_rows[c]], chunk_idx[c]) for c in range(min(model_chunks, len(chunk_rows))) ]
+    sim = bubble_up_rm_dup.DupRemovalSim()
+    sim.load(w, Tii)
+
+    def process_chunks():
+        sim.start(w, RM_DUP_PARAMS)
+        for (weights, c_idx) in chunks:
+            sim.process_chunk(weights.copy(), c_idx, sim.lookaside, sim.lookahead, sim.out_limit, sim.in_limit)
+
+    def buffer_rows():
+        # buffer updates of every row, without removing anything
+        sim.start(w, RM_DUP_PARAMS)
+        for (weights, c_idx) in chunks:
+            sim.process_weights(weights, c_idx, sim.lookaside, sim.lookahead, sim.out_limit, sim.in_limit)
+
+    benchmarks = [
+        ('chunk.tile',              lambda: chunk.tile(w,Nn,Ni,Tnn,Tii,Tn,Ti)),
+        ('chunk.chunk',             lambda: chunk.chunk(w,Nn,Ni,Tnn,Tii,Tn,Ti)),
+        ('chunk.cycle_table',       lambda: (chunk.cycle_tables.clear(), chunk.cycle_table(Nn,Ni,Tnn,Tii,Tn,Ti))),
+        ('find_dups',               lambda: find_dups.DupGroups(w, True)),
+        ('bubble_up.layer_masks',   lambda: bubble_up.layer_masks(w,Nn,Ni,Tnn,Tii,Tn,Ti)),
+        ('bubble_up.sweep',         lambda: bubble_up.sweep(masks, rows, [0,3], [1,4])),
+        # the loop engine, every bubble goes through look_for_replacement
+        ('bubble_up.process_weights', lambda: [bubble_up.process_weights(weights.copy(), 3, 4) for (weights, c_idx) in chunks]),
+        ('process_chunk',           process_chunks),
+        ('buffer',                  buffer_rows),
+    ]
+
+    # end to end, each script in its own process on the csv of the layer
+    me = os.path.dirname(os.path.abspath(__file__))
+    for (script, args) in (('bubble_up.py', '0-3 1-4 %d' % Tii),
+                           ('bubble_up_rm_dup.py', '3 4 4 4 16 2 1024 1 1 %d' % Tii),
+                           ('dup_analysis.py', '3 4 4 4 1024 1 1 %d' % Tii)):
+        cmd = [sys.executable, os.path.join(me, script), csv] + args.split()
+        benchmarks.append( (script, lambda cmd=cmd: subprocess.check_output(cmd, cwd=me)) )
+
+    return [ ("%s/%s" % (name, b), f) for (b, f) in benchmarks ]
+
+# times of every benchmark whose name matches pattern
+def run_benchmarks(pattern, repeats, end_to_end):
+    results = {}
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for (name, Nn, Ni, density, seed) in LAYERS:
+            w = make_layer(Nn, Ni, density, seed)
+            csv = os.path.join(tmp_dir, name + ".csv")
+            write_csv(csv, w[:e2e_shape[0], :e2e_shape[1]])
+
+            for (bench, f) in layer_benchmarks(name, w, csv):
+                if (pattern and not re.search(pattern, bench)):
+                    continue
+                if (bench.endswith(".py") and not end_to_end):
+                    continue
+                results[bench] = best_time(f, repeats)
+                print "%-40s %9.4fs" % (bench, results[bench])
+                sys.stdout.flush()
+    finally:
+        shutil.rmtree(tmp_dir)
+    return results
+
+def load_history(filename):
+    if (not os.path.exists(filename)):
+        return []
+    return json.load(open(filename))
+
+def save_history(filename, history):
+    # write to a temp file and rename so the history is never half written
+    (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)))
+    f = os.fdopen(fd, 'w')
+    json.dump(history, f, indent=1, sort_keys=True)
+    f.close()
+    os.rename(tmp, filename)
+
+# baseline time of every benchmark from the recent runs on host
+def baselines(history, host):
+    times = {}
+    for entry in history:
+        if (entry['host'] != host):
+            continue
+        for (bench, t) in entry['results'].items():
+            times.setdefault(bench, []).append(t)
+    return dict( (bench, float(np.median(t[-baseline_runs:]))) for (bench, t) in times.items() )
+
+# (bench, baseline, time) of the benchmarks slower than baseline * (1 + threshold)
+def regressions(results, base, threshold):
+    slow = []
+    for (bench, t) in sorted(results.items()):
+        b = base.get(bench)
+        if (b is not None and t > b * (1 + threshold) and t - b > min_delta):
+            slow.append( (bench, b, t) )
+    return slow
+
+def git_commit():
+    try:
+        me = os.path.dirname(os.path.abspath(__file__))
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=me, stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+######### MAIN ################################################################
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-o", dest="history", default="benchmark_history.json",
+                      help="JSON history of the results (default: %default)")
+    parser.add_option("-t", dest="threshold", type="float", default=0.2,
+                      help="fail if a benchmark is this much slower than its baseline (default: %default)")
+    parser.add_option("-r", dest="repeats", type="int", default=3,
+                      help="runs of each benchmark, the best one counts (default: %default)")
+    parser.add_option("-b", dest="pattern", default=None,
+                      help="only run the benchmarks whose name matches this regex")
+    parser.add_option("-E", dest="end_to_end", action="store_false", default=True,
+                      help="skip the end to end scripts")
+    parser.add_option("-n", dest="record", action="store_false", default=True,
+                      help="compare only, don't add this run to the history")
+    (opts, args) = parser.parse_args()
+
+    results = run_benchmarks(opts.pattern, opts.repeats, opts.end_to_end)
+
+    history = load_history(opts.history)
+    host = platform.node()
+    slow = regressions(results, baselines(history, host), opts.threshold)
+
+    if (opts.record):
+        history.append(dict(date=time.strftime("%Y-%m-%d %H:%M:%S"), host=host, commit=git_commit(),
+                            repeats=opts.repeats, results=results))
+        save_history(opts.history, history)
+
+    for (bench, b, t) in slow:
+        print "REGRESSION %-40s %9.4fs -> %9.4fs (%+.0f%%)" % (bench, b, t, (t/b - 1) * 100)
+    if (slow):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
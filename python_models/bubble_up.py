@@ -85,7 +85,8 @@ def process_weights(weights, lookaside, lookahead):
     zero_rows = 0;
 
     (R,Tn,Ti) = weights.shape
-    ind = np.indices((R,Tn,Ti)).swapaxes(0,3).swapaxes(0,2).swapaxes(0,1)
+    ind = chunk.origin_index(R,Tn,Ti)
+    counts = re.LaneCounts(weights)
 
     # iterate to the end to detect zero row 
     for r in range(0,R):
@@ -110,7 +111,7 @@ def process_weights(weights, lookaside, lookahead):
                 if (is_zero( weights[r,n,i] )):
                     # found a zero to fill, look for replacement
                     weights, ind, _ = re.look_for_replacement(r,n,i,weights,ind,
-                                                 lookaside,lookahead)
+                                                 lookaside,lookahead,counts)
                     
         # print "--------------------------------"
         # for tr in range(r, rmax + 1):
@@ -133,30 +134,171 @@ def process_weights(weights, lookaside, lookahead):
 
     return (R-zero_rows,ind,weights)
 
+##### Bitmask engine ##########################################################
+# same promotions as process_weights, but each row of a chunk is kept as Tn
+# uint16 nonzero masks (bit i set if weights[r,n,i] != 0) and every chunk of
+# the layer is processed at once
+
+# lookaside search order for each lane: d = 0, -1, +1, -2, +2 ... with wrap around
+def search_lanes(i, lookaside):
+    lanes = []
+    for l in range( 0, lookaside+1 ):
+        d = (l+1)/2
+        if (l % 2):
+            d *= -1
+        lanes.append( (i + d) % 16 )
+    return lanes
+
+# R x Tn nonzero masks of one chunk
+def row_masks(weights):
+    (R,Tn,Ti) = weights.shape
+    bits = np.left_shift(1, np.arange(Ti)).astype(np.uint16)
+    return ((weights != 0) * bits).sum(axis=2).astype(np.uint16)
+
+# masks of every chunk in the layer
+# returns:
+#   masks   num_chunks x R x Tn uint16, rows past the end of a chunk are zero
+#   rows    number of rows in each chunk
+def layer_masks(w,Nn,Ni,Tnn,Tii,Tn,Ti):
+    (chunk_idx, chunk_rows) = chunk.chunk_schedule(Nn,Ni,Tnn,Tii,Tn,Ti)
+    masks = np.zeros((len(chunk_rows), max(chunk_rows), Tn), dtype=np.uint16)
+    for (c, (weights, c_idx)) in enumerate(chunk.iter_chunks(w,Nn,Ni,Tnn,Tii,Tn,Ti,reuse=True)):
+        masks[c,:weights.shape[0]] = row_masks(weights)
+    return (masks, np.array(chunk_rows))
+
+# fills bubbles in every chunk, updates masks in place
+# returns the number of rows left (R - zero_rows) in each chunk
+def fill_bubbles(masks, rows, lookaside, lookahead):
+    (C,R,Tn) = masks.shape
+    reduced = np.zeros(C, dtype=np.int64)
+    search = [ search_lanes(i, lookaside) for i in range(16) ]
+
+    for r in range(0,R):
+        cur = masks[:,r,:]
+
+        # rows that are all zero are skipped
+        live = (r < rows) & cur.any(axis=1)
+        reduced += live
+
+        rmax = min(r + lookahead, R-1)
+        if (rmax <= r or not live.any()):
+            continue
+        window = masks[:,r+1:rmax+1,:]
+
+        for i in range(0,16):
+            bit_i = np.uint16(1 << i)
+            need = live[:,None] & ((cur & bit_i) == 0)
+            if (not need.any()):
+                continue
+
+            # lanes with a nonzero weight anywhere in the window
+            avail = np.bitwise_or.reduce(window, axis=1)
+
+            for ri in search[i]:
+                bit = np.uint16(1 << ri)
+                if (not (need & ((avail & bit) != 0)).any()):
+                    continue
+                has = (window & bit) != 0
+                cand = need & has.any(axis=1)
+                if (not cand.any()):
+                    continue
+                # promote from the first row with a nonzero weight
+                (c, n) = np.nonzero(cand)
+                rr = has[c,:,n].argmax(axis=1)
+                window[c,rr,n] &= ~bit
+                cur[c,n] |= bit_i
+                need[c,n] = False
+                if (not need.any()):
+                    break
+
+    return reduced
+
+# fill_bubbles for lookaside = 0 and every lookahead at once
+# without lookaside a zero can only take the next weight in its own lane, so
+# a lane issues its weights in order, one per nonzero row, whenever the next
+# one is inside the lookahead window. with
+#   cnt[c,r,lane]   nonzero weights in rows 0..r of a lane
+#   k[lane]         weights issued so far
+# row r is nonzero if any lane has cnt[r] > k, and then each lane issues one
+# weight if cnt[min(r+lookahead,R-1)] > k
+# returns the number of rows left in each chunk, len(lookaheads) x num_chunks
+def fill_bubbles_lookahead(masks, rows, lookaheads):
+    (C,R,Tn) = masks.shape
+    dtype = np.uint8 if R < 256 else np.uint32
+    bits = (masks[:,:,:,None] >> np.arange(16, dtype=np.uint16)) & 1
+    cnt = np.cumsum(bits.reshape(C,R,Tn*16), axis=1, dtype=dtype)
+    del bits
+
+    lookaheads = np.array(lookaheads)
+    k = np.zeros((len(lookaheads), C, Tn*16), dtype=dtype)
+    reduced = np.zeros((len(lookaheads), C), dtype=np.int64)
+
+    for r in range(0,R):
+        live = (cnt[None,:,r,:] > k).any(axis=2)
+        reduced += live
+        ahead = cnt[:, np.minimum(r + lookaheads, R-1), :].swapaxes(0,1)
+        k += live[:,:,None] & (ahead > k)
+
+    return reduced
+
+# evaluates every (lookaside, lookahead) pair on one layer's masks
+# returns a list of (lookaside, lookahead, reduced rows, total rows) in
+# lookahead major order, the order run_net.sh launched them in
+def sweep(masks, rows, lookasides, lookaheads):
+    # lookaside = 0 has a closed form for every lookahead
+    if (0 in lookasides):
+        no_lookaside = fill_bubbles_lookahead(masks, rows, lookaheads).sum(axis=1)
+
+    results = []
+    for (l, lookahead) in enumerate(lookaheads):
+        for lookaside in lookasides:
+            if (lookaside == 0):
+                reduced_rows = no_lookaside[l]
+            else:
+                reduced_rows = fill_bubbles(masks.copy(), rows, lookaside, lookahead).sum()
+            results.append( (lookaside, lookahead, int(reduced_rows), int(rows.sum())) )
+    return results
+
+# parses "3", "0-15" or "1,2,4" into a list of ints
+def parse_list(arg):
+    values = []
+    for a in arg.split(','):
+        if ('-' in a):
+            (lo, hi) = a.split('-')
+            values += range(int(lo), int(hi)+1)
+        else:
+            values.append(int(a))
+    return values
+
 ######### MAIN ################################################################
 
+# usage: bubble_up.py <csv> <lookaside> <lookahead> [Tii]
+#   lookaside and lookahead can be ranges (0-15) or lists (1,2,4), every pair
+#   is evaluated on a single read of the csv, one result row per pair
 def main():
-    script, filename, lookaside, lookahead = sys.argv
-    lookaside = int(lookaside)
-    lookahead = int(lookahead)
+    args = sys.argv
+    script      = args.pop(0)
+    filename    = args.pop(0)
+    lookasides  = parse_list(args.pop(0))
+    lookaheads  = parse_list(args.pop(0))
+    Tii         = int(args.pop(0)) if len(args) else 1024
 
-    # print "read filter file"
-    # w is an Nn x Ni ndarray of weights
-    w = read_filters.read_filters(filename)
+    Ti=16
+    Tn=16
+    Tnn=1024
 
-    # print "break into chunks"
-    # chunks is a list of Nrows * Tn * Ti weights
-    (chunks, chunk_idxs) = chunk.chunk(w)
+    # print "read filter file"
+    # w is an Nn x Ni ndarray of fixed point weight codes, weights = w * scale
+    (w, scale) = read_filters.read_codes(filename)
+    (Nn, Ni) = w.shape
 
     # print "processing each chunk"
-    for c in chunks:
-        process_weights(c, lookaside, lookahead)
+    (masks, rows) = layer_masks(w,Nn,Ni,Tnn,Tii,Tn,Ti)
 
     # print "cycles = ", float(total_reduced_rows)/total_rows
-    cols = (filename, lookaside, lookahead, total_reduced_rows, total_rows)
-    for c in cols:
-        print str(c) +",",
+    for (lookaside, lookahead, reduced_rows, rows_total) in sweep(masks, rows, lookasides, lookaheads):
+        cols = (filename, lookaside, lookahead, reduced_rows, rows_total)
+        print ", ".join([str(c) for c in cols]) + ","
 
 if __name__ == "__main__":
     main()
-
@@ -10,16 +10,21 @@
 import numpy as np
 import sys
 import math
+import heapq
 
 import read_filters
 import chunk
+import find_dups
+import bubble_up
+import instrument
 
 import look_for_replacement as re
 
-total_reduced_rows = 0
-total_rows = 0
+negatives_are_dups = True
 
-group_size = 16
+Ti=16
+Tn=16
+Tnn=1024
 
 def interact():
     import code
@@ -71,84 +76,36 @@ def map_weight(w):
 
 
 
-# creates a map of duplicates within a chunk
-# for each key (r,i, |weights[r,n,i]|) counts the number of duplicates
-def map_duplicates(weights):
-
-    # get dimensions
-    (R,Tn,Ti) = weights.shape
-
-    dup_map = {}
-
-    for r in range(R):
-        for n in range(Tn):
-            for i in range(Ti):
-                w = map_weight(weights[r,n,i])
-
-                # don't add zeroes
-                if w == 0 :
-                    continue
-
-                # key for this weight and position
-                key = (r, i, w)
-
-                if (not dup_map.has_key(key)):
-                   dup_map[key] = 0
-
-                dup_map[key] += 1
-
-    return dup_map              
-
-# for a given entry r,n,i scan current row and the producers original row 
-# returns:
-#   dup_index   a list of duplicates that can be removed, doesn't include the producer
-def look_for_duplicates(r, n, i, weights, ind, dup_map):
-    # get dimensions 
-    (R,Tn,Ti) = weights.shape
-
-    # producers's real index and weight
-    (pr,pn,pi) = ind[r,n,i]
-    pw = map_weight(weights[r,n,i])
-
-    #print "LD: ", (ind[r,n,i]), (r,n,i), " ",  weights[r,n,i]
-    # where to look for
-    global group_size
-    look_in_n = set(range(pn/group_size*group_size,
-                          pn/group_size*group_size+group_size))
-
-    # don't consider the producer when looking for consumers
-    #look_in_n.remove(pn)
-
-    dup_index = []
-    dup_key = (pr,pi,pw)
-
-    if (not dup_map.has_key(dup_key)):
-       return dup_index
+# index of the live duplicates within a chunk
+#   maps key (orig r, orig i, |w|) -> set of current positions (r,n,i)
+#   weights with the same key are duplicates, they have to be kept up to date
+#   as weights are moved (add/discard) so a lookup replaces a rescan of the rows
+class DupIndex:
 
-    # check current row and producers original row
-    for rr in (r,pr):
+    def __init__(self, weights, ind):
+        self.pos = {}   # key -> set of (r,n,i)
+        self.keys = {}  # (r,n,i) -> key
+        for (r,n,i) in zip(*np.nonzero(weights)):
+            self.add(weights, ind, r, n, i)
 
-        remove_n = set()
-        for nn in look_in_n:
-            for ii in range(Ti):
+    # indexes the weight at (r,n,i)
+    def add(self, weights, ind, r, n, i):
+        (orig_r, orig_n, orig_i) = chunk.origin(ind, r, n, i)
+        # weights with no original index (-1) can't be matched
+        if (orig_r < 0 or weights[r,n,i] == 0):
+            return
+        key = (orig_r, orig_i, map_weight(weights[r,n,i]))
+        self.keys[(r,n,i)] = key
+        self.pos.setdefault(key, set()).add((r,n,i))
 
-                # found all the duplicates, return
-                if (len(dup_index) == dup_map[dup_key] ):
-                   return dup_index
+    # drops position (r,n,i), before its weight or index changes
+    def discard(self, r, n, i):
+        key = self.keys.pop((r,n,i), None)
+        if (key is not None):
+            self.pos[key].discard((r,n,i))
 
-                # get target's real index
-                (dr,dn,di) = ind[rr,nn,ii]
-                dw = map_weight(weights[rr,nn,ii])
-
-                # found a dup if both the real r, i and weights are the same
-                if (dw == pw and dr == pr and di == pi):
-                   remove_n.add(nn)
-                   dup_index.append((rr,nn,ii))
-                   break
-
-        look_in_n = look_in_n.difference(remove_n)
-
-    return dup_index
+    def get(self, key):
+        return self.pos.get(key, ())
 
 # removes duplicates 
 #   inputs:
@@ -158,17 +115,19 @@ def look_for_duplicates(r, n, i, weights, ind, dup_map):
 #       dup_list    list of (r,n,i) of duplicates to remove, 
 #       out_ctr     counts the stage 1 mux outputs used for each group of n multipliers
 #       in_ctr      counts the stage 2 mux outputs used for each adder tree (n)
+#       dups        DupIndex of the chunk
+#       out_trace   LimitTrace of out_ctr
+#       in_trace    LimitTrace of in_ctr
 #   returns:
 #       stats       list of stats 
-def remove_duplicates(r, n, i, weights, ind, dup_list, out_ctr, in_ctr):
-    global ictr, octr
+def remove_duplicates(r, n, i, weights, ind, dup_list, out_ctr, in_ctr, dups, out_trace, in_trace):
     ictr = 0 #input counter (stage 2 collecting mux)
     octr = 0 #output counter (stage 1 broadcasting mux)
     dup_rm = 0
 
     # reached output limit for this cycle
     # or can't fill in the bubble
-    if ( out_ctr[n] > 0 ):
+    if ( out_trace.check(out_ctr[n]) ):
 
         # get dimensions 
         (R,Tn,Ti) = weights.shape
@@ -188,11 +147,12 @@ def remove_duplicates(r, n, i, weights, ind, dup_list, out_ctr, in_ctr):
                 continue
 
             # reached input limit for this output (adder tree)
-            if (in_ctr[dn] == 0):
+            if (not in_trace.check(in_ctr[dn])):
                continue
     
             # remove (dr,dn,di)
             #print "Du: ", (r,n,i,weights[r,n,i]), (dr,dn,di,weights[dr,dn,di]) 
+            dups.discard(dr % R, dn, di) # row -1 wraps around
             weights[dr,dn,di] = zero()
             ind[dr,dn,di] = -2 # why -2, mark as removed?
             output_dup = True 
@@ -206,6 +166,30 @@ def remove_duplicates(r, n, i, weights, ind, dup_list, out_ctr, in_ctr):
 
     return dup_rm
 
+# the checks made against one limit (out_limit or in_limit) in a run
+#   a check with u slots of the limit used passes if u < limit, so another
+#   limit makes the same decisions, and the run gives the same results, if it
+#   is above every u that passed and, if a check was blocked, not above this
+#   limit
+class LimitTrace:
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.max_passed = -1 # most slots used at a check that passed
+        self.blocked = False
+
+    # checks a counter with ctr slots left, True if one is free
+    def check(self, ctr):
+        if (ctr > 0):
+            self.max_passed = max(self.max_passed, self.limit - ctr)
+            return True
+        self.blocked = True
+        return False
+
+    # True if limit makes the same decisions as this run
+    def same(self, limit):
+        return limit > self.max_passed and (limit <= self.limit or not self.blocked)
+
 # get_global_weight_idx
 # inputs:
 #   chunk index: (n,i) of the first weight in the chunk
@@ -218,522 +202,679 @@ def get_global_weight_idx(chunk_n, chunk_i, r, n, i):
     gi = i + ii
     return (gn,gi)
 
-def calc_buffer_next_reuse(buffer, key):
-    (kn,ki) = (buffer[key][0],key[1])
-    return chunk.n_i_to_cycle(kn,ki,Nn,Ni,Tnn,Tii,Tn,Ti)
-
-# buffer functions
-# I should make a buffer class at some point
-
-# checks if key (w,i) is buffered
-# inputs:   (w,i) buffer key
-# returns:  the way it is stored in or -1 if not found
-def buffer_check(w,i):
-    # which set does this 
-    set = i % n_sets
-    w = map_weight(w)
-
-    for way in range(n_ways):
-        if (w,i) in buffer[set][way]:
-            return way
-    return -1
-
-# inserts a new product into the buffer
-# inputs    w   weight
-#           gi  global i
-#           gn  global n
-#           n   local n (which 
-# returns   true if buffer was updated
-def buffer_insert(w,gi,gn,n):
-    global glob_dups
-    global removed_dups
-    global forwarded_dups
-    global buffer
-    global glob_max_buffer_size 
-    global reuse_cycle
-    global total_dups_per_row
-    global buffer_size
-
-    set = gi % n_sets
-    way = n % n_ways
-
-    # will this product be reused?
-    if (not (w,gi) in glob_dups):
-        print "buffer_insert(%f,%d) not in glob_dups" % (w,gi)
-        sys.exit()
-    try:
-        nidx = glob_dups[(w,gi)].index(gn) 
-    except ValueError:
-        return False
-    if ( nidx == len(glob_dups[(w,gi)])-1 ):
-        # last duplicate in list, don't save
-        return False
-
-    # get the remaining duplicates
-    dups = list(glob_dups[(w,gi)][nidx+1:])
-    # can the duplicates be forwarded this cycle?
-    dups_this_row = 0
-    for d in dups[:]:
-        # duplicates issued this chunk:
-        if gn/Tn == d/Tn:
-            dups.remove(d)
-
-    if ( len(dups) == 0 ):
-        # all duplicates forwarded
-        return False
+# product buffer
+#   entries[set][way][(w,i)] -> [list of duplicate n's still to be forwarded]
+#   each set/way keeps a max-heap on the next reuse cycle of its entries so
+#   the eviction candidate (longest next reuse) is found in O(log n)
+#   heap entries are (-reuse cycle, insertion order, key) and are deleted
+#   lazily: an entry is stale once its key is gone or its cycle changed
+#   ties in reuse cycle evict the oldest entry
+#   entries are also filed under the tile (n/Tn, i/Ti) of their next
+#   duplicate so finishing a row only visits the entries it retires
+class Buffer:
+
+    def __init__(self, size, n_sets, n_ways):
+        self.n_sets = n_sets
+        self.n_ways = n_ways
+        self.set_size = size/n_sets/n_ways
+        self.entries = [[{} for way in range(n_ways)] for s in range(n_sets)]
+        self.reuse = [[{} for way in range(n_ways)] for s in range(n_sets)] # key -> (cycle, order)
+        self.heap = [[[] for way in range(n_ways)] for s in range(n_sets)]
+        self.order = 0
+        self.tiles = {} # (n/Tn, i/Ti) -> set of (set, way, key)
+        self.filed = {} # (set, way, key) -> (n/Tn, i/Ti)
+
+    # way (w,i) is stored in or -1 if not found
+    def find(self, set, key):
+        for way in range(self.n_ways):
+            if key in self.entries[set][way]:
+                return way
+        return -1
+
+    def size(self, set, way):
+        return len(self.entries[set][way])
+
+    def full(self, set, way):
+        return len(self.entries[set][way]) >= self.set_size
+
+    # adds or replaces an entry
+    def add(self, set, way, key, dups, cycle):
+        self.order += 1
+        self.entries[set][way][key] = dups
+        self.push(set, way, key, cycle, self.order)
+        self.file(set, way, key)
+
+    def remove(self, set, way, key):
+        del self.entries[set][way][key]
+        del self.reuse[set][way][key]
+        self.unfile(set, way, key)
+
+    # next reuse of key changed
+    def update(self, set, way, key, cycle):
+        (old_cycle, order) = self.reuse[set][way][key]
+        if (cycle != old_cycle):
+            self.push(set, way, key, cycle, order)
+        self.file(set, way, key)
+
+    # files an entry under the tile of its next duplicate
+    def file(self, s, way, key):
+        tile = (self.entries[s][way][key][0]/Tn, key[1]/Ti)
+        entry = (s, way, key)
+        if (self.filed.get(entry) == tile):
+            return
+        self.unfile(s, way, key)
+        self.filed[entry] = tile
+        self.tiles.setdefault(tile, set()).add(entry)
+
+    def unfile(self, set, way, key):
+        entry = (set, way, key)
+        tile = self.filed.pop(entry, None)
+        if (tile is None):
+            return
+        self.tiles[tile].discard(entry)
+        if (not self.tiles[tile]):
+            del self.tiles[tile]
+
+    # takes the entries whose next duplicate is in tile out of the tile index
+    # the caller has to update() or remove() each of them
+    def retire(self, tile):
+        entries = self.tiles.pop(tile, ())
+        for entry in entries:
+            del self.filed[entry]
+        return entries
+
+    def push(self, set, way, key, cycle, order):
+        heap = self.heap[set][way]
+        self.reuse[set][way][key] = (cycle, order)
+        heapq.heappush(heap, (-cycle, order, key))
+        # drop stale entries once they outnumber live ones
+        if (len(heap) > 2*len(self.reuse[set][way]) + 64):
+            heap[:] = [(-c, o, k) for (k, (c, o)) in self.reuse[set][way].items()]
+            heapq.heapify(heap)
+
+    # entry with the longest next reuse as (cycle, key), (-1, None) if empty
+    def victim(self, set, way):
+        heap = self.heap[set][way]
+        reuse = self.reuse[set][way]
+        while heap:
+            (c, order, key) = heap[0]
+            if (reuse.get(key) == (-c, order)):
+                return (-c, key)
+            heapq.heappop(heap)
+        return (-1, None)
 
-    # if there are still duplicates in the future
-    # add to buffer
-
-    keys = buffer[set][way].keys()
-    set_size = buffer_size/n_sets/n_ways;
-    if (len(keys) >= set_size):
-        # buffer is full
-        #continue # dont evict ever
-        
-        # find an eviction candidate
-        # policy: longest next reuse
-        victim_c = -1
-        victim_key = []
-
-        for key in keys:
-            (kn,ki) = (buffer[set][way][key][0],key[1])
-            next_c = reuse_cycle[set][way][key]
-            if next_c > victim_c:
-                victim_c = next_c
-                victim_key = key
-
-        # if victim has longer reuse than the current dup, replace it
-        replacement_c = chunk.n_i_to_cycle(dups[0], gi, Nn, Ni,Tnn,Tii,Tn,Ti)
-        if (victim_c > replacement_c):
-            #print "deleting", victim_key[0], victim_key[1]
-            del buffer[set][way][victim_key]
-            del reuse_cycle[set][way][victim_key]
-        else:
-            return False #don't add replacement to the list
-
-    # update buffer
-    buffer[set][way][(w,gi)] = dups
-    reuse_cycle[set][way][(w,gi)] = calc_buffer_next_reuse(buffer[set][way], (w,gi))
-
-    glob_max_buffer_size = max(glob_max_buffer_size, len(buffer[set][way].keys()))
-    return True
-
-def buffer_reuse(w,gn,gi):
-    global buffer
-    global reuse_cycle
-    global removed_dups
-
-    found_way = buffer_check(w,gi)
-    set = gi % n_sets
-    
-    if ( found_way < 0 ):
-        return False
-
-    if (gn not in buffer[set][found_way][(w,gi)]):
-        return False # this product was forwarded by a previous operation
-
-    # remove current key
-    buffer[set][found_way][(w,gi)].remove(gn)
-    removed_dups += 1
-
-    # have all the duplicates been forwarded?
-    if len(buffer[set][found_way][(w,gi)]) == 0:
-        # get rid of this entry in the buffer
-        del buffer[set][found_way][(w,gi)]
-        del reuse_cycle[set][found_way][(w,gi)]
-    else:
-        # update the next reuse cycle
-        reuse_cycle[set][found_way][(w,gi)] = calc_buffer_next_reuse(buffer[set][found_way], (w,gi))
-    return True
-
-def buffer_clear(gn,gi):
-    global buffer
-    global reuse_cycle
-    for w in range(n_ways):
-        for s in range(n_sets):
-            for key in buffer[s][w].keys():
-                weight,i=key
-                while i/Ti == gi/Ti and len(buffer[s][w][key]) and buffer[s][w][key][0]/Tn == gn/Tn:
-                    buffer[s][w][key].pop(0)
-                if len(buffer[s][w][key]) > 0:
-                    reuse_cycle[s][w][key] = calc_buffer_next_reuse(buffer[s][w], key)
-                else:
-                    del buffer[s][w][key]
-                    del reuse_cycle[s][w][key]
-
-def buffer_update_for_row(weights, weight_idx, r):
-    global buffer
-    global reuse_cycle
-    chunk_n, chunk_i = weight_idx
-
-    # recalculate global index
-    (R,Tn,Ti) = weights.shape
-
-    for n in range(Tn):
-        for i in range(Ti):
-            w = map_weight(weights[r,n,i])
-            
-            # forward buffered products at the beginning of a new output tile
-            #if (i/Tii == 0 and n/Tn == 0):
-            #    # start of new partial sum calculation
-            #    for tw in range(n_ways):
-            #        for ts in range(n_sets):
-            #            for key in buffer[ts][tw].keys():
-            #                for tn in buffer[ts][tw][key]:
-            #                    if tn/Tn == n/Tn:
-            #                        buffer[ts][tw][key].remove(tn)
-            #                if len(buffer[ts][tw][key]) == 0:
-            #                    # get rid of this entry in the buffer
-            #                    #print "deleting", w, gi
-            #                    del buffer[ts][tw][key]
-            #                    del reuse_cycle[ts][tw][key]
-            #                else:
-            #                    reuse_cycle[ts][tw][key] = calc_buffer_next_reuse(buffer[ts][tw], key)
-            #            
-
-            # ignore zero weights
-            if (w == 0):
-                continue
-
-            (gn,gi) = get_global_weight_idx(chunk_n, chunk_i, r, n, i)
-
-            # is this a duplicate?
-            if ( (w,gi) in glob_dups and len(glob_dups[(w,gi)]) > 1):
-                #if gi == 0:
-                #    print "dup: ", gn, gi, w
-                # is the product already in the buffer
-                found = buffer_reuse(w,gn,gi)
-                if not found:
-                    # product is not stored in the buffer
-                    buffer_insert(w,gi,gn,n)
-
-    (gn,gi) = get_global_weight_idx(chunk_n, chunk_i, r, 0, 0)
-    buffer_clear(gn,gi)
-
-# this function analyzes duplicates, but doesn't actually remove them from weights
-def process_weights(weights, weight_idx, lookaside, lookahead, out_limit, in_limit):
-
-    # recalculate global index
-    (R,Tn,Ti) = weights.shape
-    global total_rows 
-    total_rows += R
-
-    # iterate in chunk order and save duplicate values
-    for r in range(R):
-        buffer_update_for_row(weights, weight_idx, r)
-    return
-
-#################################################################################
-
-# returns a list of duplicates in the current chunk
-def look_for_live_dups(weights, ind, r, dup_map, dup_found):
-    dup_found_iter = []
-    for n in range(0,Tn):
-        for i in range(0,Ti):
-            # look for duplicates only if we haven't looked at it before
-            w = map_weight(weights[r,n,i])
-            key = (ind[r,n,i][0], ind[r,n,i][2], w)
-            if ( key not in dup_found and not is_zero(weights[r,n,i]) ):
-
-                # dup_index is list of duplicates for (r,n,i) 
-                dup_index = look_for_duplicates(r, n, i, weights, ind, dup_map)
-                dup_found.add(key)
-                if ( len(dup_index) > 0 ):
-                    dup_found_iter.append(dup_index)
-
-    return dup_found_iter
-
-# removes the duplicates in dup_found_iter in order, if possible
-def remove_dups(weights, ind, r, dup_found_iter, in_ctr, out_ctr, group_out_ctr):
-    for dup_list in dup_found_iter:
-        # for each set of duplicates
-        # first dup that can be issued (in the current row) will be issued, rest will be removed
-        for index in dup_list:
-
-            # this is the producer
-            (rr,nn,ii) = index 
-
-            # only output if the index is on the current row
-            # producer needs to allocate before consumers are removed
-            # this doesn't make sense, all duplicates are being calculated this cycle
-            #if (r != rr):
-            #   continue   
-
-            # make sure it has not exceeded group's output limit
-            if ( group_out_ctr[nn/group_size] == 0 ):
-               continue
-
-            # remove all other duplicates if possible
-            dup_rm_i = remove_duplicates(rr, nn, ii, weights, ind, dup_list, out_ctr, in_ctr)
-            global dup_rm
-            dup_rm += dup_rm_i
-
-            # exit when a remove succeeded
-            if (dup_rm_i):
-               group_out_ctr[nn/group_size] -= 1
-               break
-
-# removed duplicates and zeros from a chunk of weights
-def process_chunk(weights, weight_idx, lookaside, lookahead, out_limit, in_limit):
-
-    chunk_n, chunk_i = weight_idx
-
-    zero_rows = 0;
-
-    # recalculate global index
-    (R,Tn,Ti) = weights.shape
-
-    # store the original indices of each weight in weights
-    ind = np.indices((R,Tn,Ti)).swapaxes(0,3).swapaxes(0,2).swapaxes(0,1)
-
-    # this generates a count of the duplicates for each key within the chunk
-    dup_map = map_duplicates(weights)
-
-    dup_bubble = 0 # ignore
-    dup_bubble_pop = 0 # ignore
-
-    global out_b
-    global group_size
-    global glob_dups
-
-    # for each row
-    #   while changes
-    #       remove duplicates
-    #       fill zeros
-    for r in range(0,R):
-
-        # check for all zeros
-        if ( is_zero( weights[r,:,:] ) ):
-            # print r # print all lines that are all zeroes
-            zero_rows += 1
-            continue
-
-        # counter for the limits
-        in_ctr = [in_limit] * Tn # input limit per filter (m), max inputs to adder tree
-        out_ctr = [out_limit] * Ti # number of products that can be broadcast for an input i
-        group_out_ctr = [out_b] * (Tn / group_size) # number of products that can be broadcast for an input i
-        ictr = 0 # number of products reused
-        octr = 0 # number of products broadcast
-        changed = True
-        dup_found = set() # track the duplicates found so we don't double count them
-
-        # fill bubbles
-        # how are stats maintained across iterations?
-        # are we potentially double promoting beyond the lookahead window?
-        while changed:
-            changed = False
-
-            # look for buffered duplicates broadcasting to this row
-
-            # list of list of duplicate indicies
-            # [[ (r,n,i) ]]
-            dup_found_iter = look_for_live_dups(weights, ind, r, dup_map, dup_found)
-            # add duplicate products already stored in the buffer
-
-            # for testing
-            # buffer[0][0][(map_weight(weights[0,0,0]),0)] = [0]
-            for dup_set in dup_found_iter[:]:
-                (cr,cn,ci) = dup_set[0]
-                w = weights[cr,cn,ci]
-            
-                (orig_r, orig_n, orig_i) = ind[cr,cn,ci]
-                (gn,gi) = get_global_weight_idx(chunk_n, chunk_i, orig_r, orig_n, orig_i)
-                way =  buffer_check(w,gi)
-
-                # add buffered duplicates to list as (-1,way,set) 
-                if ( way >= 0 ):
-                    s = gi % n_sets
-                    dup_set.insert( 0, (-1,cn,ci) ) #FIXME: cn,ci are placeholders, we need to do something different for the buffer config
-
-                # remove singletons 
-                if (len(dup_set) == 1):
-                    dup_found_iter.remove(dup_set) 
-            
-            # now we have a list of list of duplicates in the current row and buffer
-            # if a duplicate is in the buffer then it is stored as (-1,n,i)
-            
-            # choose a producer for each set of duplicates and put it at the front of the set
-
-            # simple heuristic to choose producer
-            #   1. choose buffered product
-            #   2. choose the first live dup
-            #   this will happen natural since buffered products are added to the front of the list
-
-            # prioritize removal here
-            # reorder the duplicate removal order
-            # do the ones with more duplicates first
-            dup_found_iter.sort(key=len, reverse=True)
-
-            # pick the filter with the least number of duplicates to
-            # send first, this should reduce input dependences
-            n_ctr = {}
-            for dup_list in dup_found_iter:
-                for element in dup_list:
-                    n_ctr[element[1]] = n_ctr.get(element[1],0) + 1
-            
-            for tmp in dup_found_iter:
-                tmp.sort(key=lambda fn: n_ctr.get(fn[1], Tn*Ti+1))
-
-            # remove duplicates in list order
-            #   checking for constraints
-            remove_dups(weights, ind, r, dup_found_iter, in_ctr, out_ctr, group_out_ctr)
-
-            # this may create a zero row, but we can't skip it since we've used this cycle to do all this stuff
-
-            # remove all the zeros in the row
-            for n in range(0,Tn):
-                for i in range(0,Ti):
-    
-                    # fill in the bubble
-                    if ( is_zero( weights[r,n,i] )):
-                        orig_zero =  ( (r,n,i) == ind[r,n,i] ).all()
-                        # found a zero to fill, look for replacement
-                        zero_removed = re.look_for_replacement( r, n, i, weights, ind, lookaside, lookahead)
-                        global zero_rm
-                        if orig_zero:
-                            zero_rm += zero_removed
-                        changed = changed or zero_removed
-   
-        # end of change loop
-
-        # now we know which products will be calculated this cycle
-
-        # for all buffered dups that were not forwarded, remove them from the buffer list
-
-        # update the buffer with new products produced in this cycle (row)
-        buffer_update_for_row(weights, weight_idx, r)
-
-    # end of row loop
-
-    global total_reduced_rows 
-    total_reduced_rows += R - zero_rows
-    global total_rows 
-    total_rows += R
 
 # generate list of all duplicates in filter
-# use tiling to append n's in execution order
+# find_dups groups them with numpy, n's are in execution order
 # inputs:
 #   w           Nn x Ni matrix of weights
 # returns:
-#   glob_dups   a dictionary that maps (weight,i)->[list of duplicate n's]
+#   glob_dups   DupGroups of the (weight,i) duplicates
 def build_dups(w):
-    cycle=0
-    for nnn in range(0, Nn, Tnn):
-        for iii in range(0, Ni, Tii):
-            for nn in range(nnn, min(nnn+Tnn,Nn), Tn):
-                for ii in range(iii, min(iii+Tii,Ni), Ti):
-                    for n in range(nn, min(nn+Tn,Nn), 1):
-                        for i in range(ii, min(ii+Ti,Ni), 1):
-                            weight = map_weight(w[n,i])
-                            if (weight == 0):
-                                continue
-                            if ( not (weight,i) in glob_dups ):
-                                glob_dups[(weight,i)] = []
-                            glob_dups[(weight,i)].append(n)
-                            #glob_dups[(weight,i)].append((n,cycle))
-                    cycle += 1
-    # delete singletons
-    for k in glob_dups.keys():
-        (kw,ki) = k
-        n_list = glob_dups[k]
-        if (len(n_list) == 1):
-            del glob_dups[k]
-            continue
-    return glob_dups
-
-######### MAIN ################################################################
-
-args = sys.argv
-script      = args.pop(0)
-filename    = args.pop(0)
-lookaside   = int(args.pop(0))
-lookahead   = int(args.pop(0))
-out_limit   = int(args.pop(0))
-in_limit    = int(args.pop(0))
-group_size  = int(args.pop(0))
-out_b       = int(args.pop(0))
-buffer_size = int(args.pop(0))
-n_sets      = int(args.pop(0))
-n_ways      = int(args.pop(0))
-Tii         = int(args.pop(0))
-negatives_are_dups = True
-
-Ti=16
-Tn=16
-Tnn=1024
-
-#print "read filter file"
-# w is an Nn x Ni ndarray of weights
-w = read_filters.read_filters(filename)
+    return find_dups.DupGroups(w, negatives_are_dups)
+
+# model parameters, in command line order after the csv
+PARAMS = ('lookaside', 'lookahead', 'out_limit', 'in_limit', 'group_size', 'out_b',
+          'buffer_size', 'n_sets', 'n_ways', 'Tii')
+
+# parameters that can be swept in one run_limits call
+LIMITS = ('out_limit', 'in_limit')
+
+# duplicate removal model
+#   holds the state of a run (buffer, counters) so one process can evaluate
+#   many configurations, the layer state (duplicate groups, cycle table,
+#   tiled chunks) is built once per (weights, Tii) and shared by the runs
+class DupRemovalSim:
+
+    def __init__(self):
+        self.weights = None
+        self.Tii = None
+        self.limit_runs = {}
+
+    # builds the state of a layer, nothing to do if it is already loaded
+    #   the duplicate groups only depend on the weights, the rest on Tii too
+    def load(self, weights, Tii):
+        if (self.weights is weights and self.Tii == Tii):
+            return
+        (Nn, Ni) = weights.shape
+
+        if (self.weights is not weights):
+            with instrument.timer('build_dups'):
+                self.glob_dups = build_dups(weights)
+            self.limit_runs = {}
+
+            # get total # duplicates
+            self.total_dups = self.glob_dups.total_dups() # don't count the first duplicate (producer)
+            self.total_dup_lists = len(self.glob_dups)
+            self.avg_dup_list_len = np.float64(self.total_dups)/self.total_dup_lists
+
+        with instrument.timer('chunk'):
+            # cycle_table[n, i/Ti] is the cycle weight (n,i) is processed in
+            self.cycle_table = chunk.cycle_table(Nn,Ni,Tnn,Tii,Tn,Ti)
+        self.weights = weights
+        self.Tii = Tii
+
+    # runs the model on one configuration
+    # inputs:
+    #   weights     Nn x Ni matrix of weights
+    #   params      dict of PARAMS
+    # returns:
+    #   dict of stats
+    def run(self, weights, params):
+        self.start(weights, params)
+
+        # chunks of Nrows * Tn * Ti weights are streamed one at a time, every
+        # run refills them from the weights, process_chunk changes them
+        (Nn, Ni) = weights.shape
+        for (c, c_idx) in chunk.iter_chunks(weights,Nn,Ni,Tnn,self.Tii,Tn,Ti,reuse=True):
+            self.process_chunk(c, c_idx, self.lookaside, self.lookahead, self.out_limit, self.in_limit)
+
+        # NOTE zero_rm  includes zeros created by removed dups
+        return dict(zero_rm=self.zero_rm, dup_rm=self.dup_rm, total_dups=self.total_dups,
+                    total_reduced_rows=self.total_reduced_rows, total_rows=self.total_rows,
+                    removed_dups=self.removed_dups, glob_max_buffer_size=self.glob_max_buffer_size,
+                    avg_dup_list_len=self.avg_dup_list_len)
+
+    # loads the layer and starts a run of params with an empty buffer and
+    # counters, process_chunk can then be called on the chunks in order
+    def start(self, weights, params):
+        self.load(weights, params['Tii'])
+        for p in PARAMS:
+            setattr(self, p, params[p])
+
+        # buffer[set][way][(w,i)]->[list of duplicates]
+        self.buffer = Buffer(self.buffer_size, self.n_sets, self.n_ways)
+        self.glob_max_buffer_size = 0
+
+        self.removed_dups = 0
+        self.zero_rm = 0
+        self.dup_rm = 0
+        self.total_reduced_rows = 0
+        self.total_rows = 0
+        self.out_trace = LimitTrace(self.out_limit)
+        self.in_trace = LimitTrace(self.in_limit)
+
+    # run, unless an earlier run with the same params but other limits makes
+    # the same decisions (LimitTrace), then its stats are returned
+    #   instrumented, stats['profile'] has what this run measured, or
+    #   shared=True if it reused an earlier run
+    def run_shared(self, weights, params):
+        self.load(weights, params['Tii'])
+        key = tuple(params[p] for p in PARAMS if p not in LIMITS)
+        runs = self.limit_runs.setdefault(key, [])
+        for (out_trace, in_trace, stats) in runs:
+            if (out_trace.same(params['out_limit']) and in_trace.same(params['in_limit'])):
+                return dict(stats, profile=dict(shared=True))
+        stats = self.run(weights, params)
+        if (instrument.enabled):
+            stats['profile'] = instrument.take()
+        runs.append( (self.out_trace, self.in_trace, stats) )
+        return dict(stats)
+
+    # runs params with every (out_limit, in_limit) pair in limits
+    #   the largest limits go first, their runs are shared by the most pairs
+    # returns:
+    #   list of stats in the order of limits
+    def run_limits(self, weights, params, limits):
+        stats = {}
+        for (out_limit, in_limit) in sorted(set(limits), reverse=True):
+            stats[(out_limit, in_limit)] = self.run_shared(weights,
+                    dict(params, out_limit=out_limit, in_limit=in_limit))
+        return [stats[l] for l in limits]
+
+    def calc_buffer_next_reuse(self, dups, key):
+        (kn,ki) = (dups[0],key[1])
+        return self.cycle_table[kn, ki/Ti]
+
+    # buffer functions
+
+    # checks if key (w,i) is buffered
+    # inputs:   (w,i) buffer key
+    # returns:  the way it is stored in or -1 if not found
+    def buffer_check(self, w, i):
+        # which set does this 
+        set = i % self.n_sets
+        w = map_weight(w)
+        return self.buffer.find(set, (w,i))
+
+    # inserts a new product into the buffer
+    # inputs    w   weight
+    #           gi  global i
+    #           gn  global n
+    #           n   local n (which 
+    # returns   true if buffer was updated
+    def buffer_insert(self, w, gi, gn, n):
+        glob_dups = self.glob_dups
+        buffer = self.buffer
+
+        set = gi % self.n_sets
+        way = n % self.n_ways
+
+        # will this product be reused?
+        g = glob_dups.group(w,gi)
+        if (g < 0):
+            print "buffer_insert(%f,%d) not in glob_dups" % (w,gi)
+            sys.exit()
+        s = glob_dups.index(g,gn)
+        if (s < 0):
+            return False
+        if ( glob_dups.next(g,s) < 0 ):
+            # last duplicate in list, don't save
+            return False
+
+        # get the remaining duplicates
+        # except the ones issued this chunk, they are forwarded this cycle
+        dups = glob_dups.remaining(g, s+1, (gn/Tn+1)*Tn).tolist()
+
+        if ( len(dups) == 0 ):
+            # all duplicates forwarded
+            return False
+
+        # if there are still duplicates in the future
+        # add to buffer
+
+        if (buffer.full(set, way)):
+            # buffer is full
+            #continue # dont evict ever
+            
+            # find an eviction candidate
+            # policy: longest next reuse
+            (victim_c, victim_key) = buffer.victim(set, way)
+
+            # if victim has longer reuse than the current dup, replace it
+            replacement_c = self.cycle_table[dups[0], gi/Ti]
+            if (victim_c > replacement_c):
+                #print "deleting", victim_key[0], victim_key[1]
+                buffer.remove(set, way, victim_key)
+                instrument.count('buffer_evictions')
+            else:
+                instrument.count('buffer_bypass')
+                return False #don't add replacement to the list
+
+        # update buffer
+        buffer.add(set, way, (w,gi), dups, self.calc_buffer_next_reuse(dups, (w,gi)))
+        instrument.count('buffer_inserts')
+
+        self.glob_max_buffer_size = max(self.glob_max_buffer_size, buffer.size(set, way))
+        return True
+
+    def buffer_reuse(self, w, gn, gi):
+        buffer = self.buffer
+
+        found_way = self.buffer_check(w,gi)
+        set = gi % self.n_sets
+        
+        if ( found_way < 0 ):
+            return False
+
+        dups = buffer.entries[set][found_way][(w,gi)]
+        if (gn not in dups):
+            return False # this product was forwarded by a previous operation
+
+        # remove current key
+        dups.remove(gn)
+        self.removed_dups += 1
+        instrument.count('buffer_hits')
+
+        # have all the duplicates been forwarded?
+        if len(dups) == 0:
+            # get rid of this entry in the buffer
+            buffer.remove(set, found_way, (w,gi))
+        else:
+            # update the next reuse cycle
+            buffer.update(set, found_way, (w,gi), self.calc_buffer_next_reuse(dups, (w,gi)))
+        return True
+
+    # drops the duplicates of the tile (gn/Tn, gi/Ti) that were not forwarded
+    def buffer_clear(self, gn, gi):
+        buffer = self.buffer
+        for (s, w, key) in buffer.retire( (gn/Tn, gi/Ti) ):
+            dups = buffer.entries[s][w][key]
+            while len(dups) and dups[0]/Tn == gn/Tn:
+                dups.pop(0)
+            if len(dups) > 0:
+                buffer.update(s, w, key, self.calc_buffer_next_reuse(dups, key))
+            else:
+                buffer.remove(s, w, key)
+
+    @instrument.timed('buffer')
+    def buffer_update_for_row(self, weights, weight_idx, r):
+        chunk_n, chunk_i = weight_idx
+
+        # recalculate global index
+        (R,Tn,Ti) = weights.shape
 
-#Nn = 32
-#Ni = 2048
-#w = np.zeros((Nn,Ni))
-#w = np.arange(Nn*Ni).reshape((Nn,Ni))
-#w[0,0] = 1
-#w[1,0] = w[0,0]
-#w[16,0] = w[0,0]
-#print w
+        for n in range(Tn):
+            for i in range(Ti):
+                w = map_weight(weights[r,n,i])
+                
+                # forward buffered products at the beginning of a new output tile
+                #if (i/Tii == 0 and n/Tn == 0):
+                #    # start of new partial sum calculation
+                #    for tw in range(n_ways):
+                #        for ts in range(n_sets):
+                #            for key in buffer[ts][tw].keys():
+                #                for tn in buffer[ts][tw][key]:
+                #                    if tn/Tn == n/Tn:
+                #                        buffer[ts][tw][key].remove(tn)
+                #                if len(buffer[ts][tw][key]) == 0:
+                #                    # get rid of this entry in the buffer
+                #                    #print "deleting", w, gi
+                #                    del buffer[ts][tw][key]
+                #                    del reuse_cycle[ts][tw][key]
+                #                else:
+                #                    reuse_cycle[ts][tw][key] = calc_buffer_next_reuse(buffer[ts][tw], key)
+                #            
+
+                # ignore zero weights
+                if (w == 0):
+                    continue
 
-(Nn, Ni) = w.shape
+                (gn,gi) = get_global_weight_idx(chunk_n, chunk_i, r, n, i)
 
-num_zeros = np.sum( w == 0 )
+                # is this a duplicate?
+                if ( self.glob_dups.group(w,gi) >= 0 ):
+                    #if gi == 0:
+                    #    print "dup: ", gn, gi, w
+                    # is the product already in the buffer
+                    found = self.buffer_reuse(w,gn,gi)
+                    if not found:
+                        # product is not stored in the buffer
+                        self.buffer_insert(w,gi,gn,n)
 
-#print w.shape
+        (gn,gi) = get_global_weight_idx(chunk_n, chunk_i, r, 0, 0)
+        self.buffer_clear(gn,gi)
 
-glob_weights = w
-glob_dups = {}
-glob_max_buffer_size = 0
+    # this function analyzes duplicates, but doesn't actually remove them from weights
+    def process_weights(self, weights, weight_idx, lookaside, lookahead, out_limit, in_limit):
 
-total_dups = 0 # total number of duplicates not including the original 
-removed_dups = 0
-forwarded_dups = 0
-total_dups_per_row = 0
-zero_rm = 0
-dup_rm = 0
-ictr = 0
-octr = 0
+        # recalculate global index
+        (R,Tn,Ti) = weights.shape
+        self.total_rows += R
+
+        # iterate in chunk order and save duplicate values
+        for r in range(R):
+            self.buffer_update_for_row(weights, weight_idx, r)
+        return
+
+    #############################################################################
+
+    # for a given entry r,n,i look in the current row and the producers original row 
+    # returns:
+    #   dup_index   a list of duplicates that can be removed, includes the producer
+    def look_for_duplicates(self, r, n, i, weights, ind, dups):
+        # producers's real index and weight
+        (pr,pn,pi) = chunk.origin(ind, r, n, i)
+        pw = map_weight(weights[r,n,i])
+
+        # where to look for
+        group_size = self.group_size
+        n0 = pn/group_size*group_size
+
+        # live copies in the producer's group of n
+        live = [(rr,nn,ii) for (rr,nn,ii) in dups.get((pr,pi,pw)) if n0 <= nn < n0+group_size]
+
+        # check current row and producers original row
+        #   one duplicate per n, the first one in i order
+        dup_index = []
+        found_n = set()
+        for rr in (r,pr):
+            for (nn,ii) in sorted( (nn,ii) for (lr,nn,ii) in live if lr == rr ):
+                if (nn not in found_n):
+                    found_n.add(nn)
+                    dup_index.append((rr,nn,ii))
+
+        return dup_index
+
+    # returns a list of duplicates in the current chunk
+    @instrument.timed('dup_search')
+    def look_for_live_dups(self, weights, ind, r, dups, dup_found):
+        dup_found_iter = []
+        for n in range(0,Tn):
+            for i in range(0,Ti):
+                # look for duplicates only if we haven't looked at it before
+                w = map_weight(weights[r,n,i])
+                (orig_r, orig_n, orig_i) = chunk.origin(ind, r, n, i)
+                key = (orig_r, orig_i, w)
+                if ( key not in dup_found and not is_zero(weights[r,n,i]) ):
+
+                    # dup_index is list of duplicates for (r,n,i) 
+                    dup_index = self.look_for_duplicates(r, n, i, weights, ind, dups)
+                    dup_found.add(key)
+                    if ( len(dup_index) > 0 ):
+                        dup_found_iter.append(dup_index)
+
+        return dup_found_iter
+
+    # removes the duplicates in dup_found_iter in order, if possible
+    @instrument.timed('remove_dups')
+    def remove_dups(self, weights, ind, r, dup_found_iter, in_ctr, out_ctr, group_out_ctr, dups):
+        group_size = self.group_size
+        for dup_list in dup_found_iter:
+            # for each set of duplicates
+            # first dup that can be issued (in the current row) will be issued, rest will be removed
+            for index in dup_list:
+
+                # this is the producer
+                (rr,nn,ii) = index 
+
+                # only output if the index is on the current row
+                # producer needs to allocate before consumers are removed
+                # this doesn't make sense, all duplicates are being calculated this cycle
+                #if (r != rr):
+                #   continue   
+
+                # make sure it has not exceeded group's output limit
+                if ( group_out_ctr[nn/group_size] == 0 ):
+                   continue
+
+                # remove all other duplicates if possible
+                dup_rm_i = remove_duplicates(rr, nn, ii, weights, ind, dup_list, out_ctr, in_ctr, dups,
+                                             self.out_trace, self.in_trace)
+                self.dup_rm += dup_rm_i
+
+                # exit when a remove succeeded
+                if (dup_rm_i):
+                   group_out_ctr[nn/group_size] -= 1
+                   break
 
-# buffer[set][way][(w,i)]->[list of duplicates]
-buffer =        [[{} for i in range(n_ways)] for j in range(n_sets)]
-reuse_cycle =   [[{} for i in range(n_ways)] for j in range(n_sets)]
+    # removed duplicates and zeros from a chunk of weights
+    @instrument.timed('process_chunk')
+    def process_chunk(self, weights, weight_idx, lookaside, lookahead, out_limit, in_limit):
 
-glob_dups = build_dups(w)
+        chunk_n, chunk_i = weight_idx
 
-# get total # duplicates
-for key in glob_dups:
-    total_dups += len(glob_dups[key])-1 # don't count the first duplicate (producer)
+        zero_rows = 0;
 
-total_dup_lists = len(glob_dups)
-avg_dup_list_len = np.float64(total_dups)/total_dup_lists
+        # recalculate global index
+        (R,Tn,Ti) = weights.shape
 
-# chunks is a list of Nrows * Tn * Ti weight ndarrays
-(chunks, chunk_idxs) = chunk.chunk(w,Nn,Ni,Tnn,Tii,Tn,Ti)
+        # store the original indices of each weight in weights
+        ind = chunk.origin_index(R,Tn,Ti)
 
-#print "processing each chunk"
-np.set_printoptions(threshold=np.inf)
-for (c, c_idx) in zip(chunks, chunk_idxs):
-#    process_weights(c, c_idx, lookaside, lookahead, out_limit, in_limit)
-    process_chunk(c, c_idx, lookaside, lookahead, out_limit, in_limit)
+        with instrument.timer('dup_index'):
+            # this indexes the duplicates for each key within the chunk
+            dups = DupIndex(weights, ind)
 
-avg_dups_per_row = np.float64(total_dups_per_row)/(total_rows*Ti)
+            # nonzero counts of each lane, to skip empty lookahead windows
+            counts = re.LaneCounts(weights)
 
-# Print stats
+        dup_bubble = 0 # ignore
+        dup_bubble_pop = 0 # ignore
 
-# NOTE zero_rm  includes zeros created by removed dups
+        # for each row
+        #   while changes
+        #       remove duplicates
+        #       fill zeros
+        for r in range(0,R):
 
-#cols = (filename, avg_dup_list_len, avg_dups_per_row, total_rows)
-cols = (filename, lookaside, lookahead, out_limit, in_limit, group_size, out_b, zero_rm, dup_rm, total_dups, total_reduced_rows, total_rows)
-#cols = (filename, lookaside, lookahead, out_limit, in_limit, removed_dups, total_dups)
-#cols = (filename, lookaside, lookahead, out_limit, in_limit, forwarded_dups, removed_dups, total_dups, glob_max_buffer_size)
-for c in cols:
-    if (type(c) is float):
-        print "%.2f," % c, 
-    elif (type(c) is int):
-        print "%d," % c, 
-    else:
-        print "%s," % c, 
+            # check for all zeros
+            if ( is_zero( weights[r,:,:] ) ):
+                # print r # print all lines that are all zeroes
+                zero_rows += 1
+                continue
 
+            # counter for the limits
+            in_ctr = [in_limit] * Tn # input limit per filter (m), max inputs to adder tree
+            out_ctr = [out_limit] * Ti # number of products that can be broadcast for an input i
+            group_out_ctr = [self.out_b] * (Tn / self.group_size) # number of products that can be broadcast for an input i
+            ictr = 0 # number of products reused
+            octr = 0 # number of products broadcast
+            changed = True
+            dup_found = set() # track the duplicates found so we don't double count them
+            iterations = 0
+
+            # fill bubbles
+            # how are stats maintained across iterations?
+            # are we potentially double promoting beyond the lookahead window?
+            while changed:
+                changed = False
+                iterations += 1
+
+                # look for buffered duplicates broadcasting to this row
+
+                # list of list of duplicate indicies
+                # [[ (r,n,i) ]]
+                dup_found_iter = self.look_for_live_dups(weights, ind, r, dups, dup_found)
+                # add duplicate products already stored in the buffer
+
+                # for testing
+                # buffer[0][0][(map_weight(weights[0,0,0]),0)] = [0]
+                for dup_set in dup_found_iter[:]:
+                    (cr,cn,ci) = dup_set[0]
+                    w = weights[cr,cn,ci]
+                
+                    (orig_r, orig_n, orig_i) = chunk.origin(ind, cr, cn, ci)
+                    (gn,gi) = get_global_weight_idx(chunk_n, chunk_i, orig_r, orig_n, orig_i)
+                    way =  self.buffer_check(w,gi)
+
+                    # add buffered duplicates to list as (-1,way,set) 
+                    if ( way >= 0 ):
+                        s = gi % self.n_sets
+                        dup_set.insert( 0, (-1,cn,ci) ) #FIXME: cn,ci are placeholders, we need to do something different for the buffer config
+
+                    # remove singletons 
+                    if (len(dup_set) == 1):
+                        dup_found_iter.remove(dup_set) 
+                
+                # now we have a list of list of duplicates in the current row and buffer
+                # if a duplicate is in the buffer then it is stored as (-1,n,i)
+                
+                # choose a producer for each set of duplicates and put it at the front of the set
+
+                # simple heuristic to choose producer
+                #   1. choose buffered product
+                #   2. choose the first live dup
+                #   this will happen natural since buffered products are added to the front of the list
+
+                # prioritize removal here
+                # reorder the duplicate removal order
+                # do the ones with more duplicates first
+                dup_found_iter.sort(key=len, reverse=True)
+
+                # pick the filter with the least number of duplicates to
+                # send first, this should reduce input dependences
+                n_ctr = {}
+                for dup_list in dup_found_iter:
+                    for element in dup_list:
+                        n_ctr[element[1]] = n_ctr.get(element[1],0) + 1
+                
+                for tmp in dup_found_iter:
+                    tmp.sort(key=lambda fn: n_ctr.get(fn[1], Tn*Ti+1))
+
+                # remove duplicates in list order
+                #   checking for constraints
+                self.remove_dups(weights, ind, r, dup_found_iter, in_ctr, out_ctr, group_out_ctr, dups)
+
+                # this may create a zero row, but we can't skip it since we've used this cycle to do all this stuff
+
+                # remove all the zeros in the row
+                for n in range(0,Tn):
+                    for i in range(0,Ti):
+        
+                        # fill in the bubble
+                        if ( is_zero( weights[r,n,i] )):
+                            orig_zero = chunk.at_origin(ind, r, n, i)
+                            # found a zero to fill, look for replacement
+                            found = re.find_replacement(r, n, i, weights, lookaside, lookahead, counts)
+                            zero_removed = 0
+                            if (found):
+                                (rr, ri) = found
+                                dups.discard(rr, n, ri)
+                                dups.discard(rr, n, i)
+                                re.replace(r, n, i, rr, ri, weights, ind, counts)
+                                dups.add(weights, ind, r, n, i)
+                                zero_removed = 1
+                                if (instrument.enabled):
+                                    instrument.count('replacements')
+                            if orig_zero:
+                                self.zero_rm += zero_removed
+                            changed = changed or zero_removed
+       
+            # end of change loop
+            instrument.hist('change_iterations', iterations)
+
+            # now we know which products will be calculated this cycle
+
+            # for all buffered dups that were not forwarded, remove them from the buffer list
+
+            # update the buffer with new products produced in this cycle (row)
+            self.buffer_update_for_row(weights, weight_idx, r)
+
+        # end of row loop
+
+        self.total_reduced_rows += R - zero_rows
+        self.total_rows += R
+
+# the result row printed for one run
+def format_row(filename, params, stats):
+    cols = (filename,) + tuple(params[p] for p in PARAMS[:6]) + \
+           tuple(stats[s] for s in ('zero_rm', 'dup_rm', 'total_dups', 'total_reduced_rows', 'total_rows'))
+    #cols = (filename, avg_dup_list_len, avg_dups_per_row, total_rows)
+    #cols = (filename, lookaside, lookahead, out_limit, in_limit, removed_dups, total_dups)
+    #cols = (filename, lookaside, lookahead, out_limit, in_limit, forwarded_dups, removed_dups, total_dups, glob_max_buffer_size)
+    row = []
+    for c in cols:
+        if (type(c) is float):
+            row.append("%.2f," % c)
+        elif (type(c) is int):
+            row.append("%d," % c)
+        else:
+            row.append("%s," % c)
+    return " ".join(row)
 
+######### MAIN ################################################################
 
+# usage: bubble_up_rm_dup.py <csv> <PARAMS>
+#   out_limit and in_limit can be ranges (1-4) or lists (1,2,4,8,16), every
+#   pair is evaluated on a single read of the csv, one result row per pair in
+#   out_limit major order
+def main():
+    args = sys.argv
+    script      = args.pop(0)
+    filename    = args.pop(0)
+    params = {}
+    for p in PARAMS:
+        params[p] = args.pop(0)
+    limits = [(out_limit, in_limit) for out_limit in bubble_up.parse_list(params['out_limit'])
+                                    for in_limit in bubble_up.parse_list(params['in_limit'])]
+    for p in PARAMS:
+        if (p not in LIMITS):
+            params[p] = int(params[p])
+
+    #print "read filter file"
+    # w is an Nn x Ni ndarray of fixed point weight codes, weights = w * scale
+    with instrument.timer('read_filters'):
+        (w, scale) = read_filters.read_codes(filename)
+
+    np.set_printoptions(threshold=np.inf)
+    sim = DupRemovalSim()
+    for ((out_limit, in_limit), stats) in zip(limits, sim.run_limits(w, params, limits)):
+        row_params = dict(params, out_limit=out_limit, in_limit=in_limit)
+        row = format_row(filename, row_params, stats)
+        print row
+        # with INSTRUMENT set, the phase times and counters of this row
+        instrument.write_row(row, stats.get('profile'), script=script, params=row_params)
+
+if __name__ == "__main__":
+    main()
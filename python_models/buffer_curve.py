@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# OPT bound on the duplicates a product buffer removes, for every size
+#   dup_analysis.py simulates one buffer size at a time. this runs a single
+#   OPT stack pass (opt_stack.py) over the reuse stream of the duplicates
+#   instead, which gives every fully associative size at once
+#
+#   the rows are a bound, not a simulation: dup_analysis only compares whole
+#   cycles and holds a hit entry until its last duplicate in the row, so it
+#   removes up to a few percent fewer duplicates than the exact OPT here.
+#   the rows have their own format so they can't be mistaken for
+#   dup_analysis.py rows
+
+import sys
+import numpy as np
+
+import read_filters
+import find_dups
+import opt_stack
+import bubble_up
+
+negatives_are_dups = True
+
+Ti=16
+Tn=16
+Tnn=1024
+
+# tile level reuse stream of the duplicates, in processing order
+#   the duplicates of a (w,gi) in one tile are all issued in the same cycle,
+#   the first one looks in the buffer and the rest are forwarded or hit with it
+# returns:
+#   keys        dup group of each reference
+#   next_ref    index of the next reference to the same group
+#   extra       number of duplicates after the first one in the tile
+def reuse_stream(glob_dups, Tii):
+    lengths = np.diff(glob_dups.offsets)
+    groups = np.repeat(np.arange(len(glob_dups)), lengths)
+    inputs = np.repeat(glob_dups.inputs, lengths)
+    ns = glob_dups.ns
+
+    first = np.ones(len(ns), dtype=bool)
+    first[1:] = (groups[1:] != groups[:-1]) | (ns[1:]/Tn != ns[:-1]/Tn)
+    starts = np.flatnonzero(first)
+    extra = np.diff(np.append(starts, len(ns))) - 1
+    (groups, inputs, ns) = (groups[starts], inputs[starts], ns[starts])
+
+    # dup_analysis order: chunk (n/Tnn, i/Tii, n/Tn), row, then n and i
+    # within the row. this is not cycle order, the ragged last block of
+    # inputs shares its cycles between tiles
+    di = inputs % Tii
+    order = np.lexsort((di % Ti, ns % Tn, di / Ti, ns / Tn, inputs / Tii, ns / Tnn))
+    keys = groups[order]
+    return (keys, opt_stack.next_refs(keys), extra[order])
+
+# forwarded and removed duplicates of fully associative OPT buffers of every
+# size, dup_analysis evicts the entry with the longest next reuse too
+# returns:
+#   list of (forwarded_dups, removed_dups) for each size
+def buffer_curve(glob_dups, buffer_sizes, Tii):
+    (keys, next_ref, extra) = reuse_stream(glob_dups, Tii)
+    depth = max(buffer_sizes)
+    dist = opt_stack.stack_distances(keys, next_ref, depth)
+
+    # a reference at distance d hits in buffers of d entries or more
+    hits = np.cumsum(np.bincount(dist, minlength=depth+1))
+    hit_extra = np.cumsum(np.bincount(dist, weights=extra, minlength=depth+1))
+
+    curve = []
+    for size in buffer_sizes:
+        n_hits = int(hits[size] - hits[0])
+        forwarded = int(extra.sum() - (hit_extra[size] - hit_extra[0]))
+        curve.append( (forwarded, int(extra.sum()) + n_hits) )
+    return curve
+
+# the result row of one buffer size
+def format_row(filename, Tii, buffer_size, forwarded_dups, removed_dups, total_dups):
+    cols = (filename, "opt", Tii, buffer_size, forwarded_dups, removed_dups, total_dups)
+    return ", ".join([str(c) for c in cols]) + ","
+
+######### MAIN ################################################################
+
+# usage: buffer_curve.py <csv> <buffer_size> <Tii>
+#   buffer_size can be a range (16-64) or a list (16,32,64), one result row
+#   per size from a single pass:
+#   csv, opt, Tii, buffer_size, opt_forwarded_dups, opt_removed_dups, total_dups,
+def main():
+    args = sys.argv
+    script      = args.pop(0)
+    filename    = args.pop(0)
+    buffer_sizes = bubble_up.parse_list(args.pop(0))
+    Tii         = int(args.pop(0))
+
+    # w is an Nn x Ni ndarray of fixed point weight codes, weights = w * scale
+    (w, scale) = read_filters.read_codes(filename)
+
+    glob_dups = find_dups.DupGroups(w, negatives_are_dups)
+    total_dups = glob_dups.total_dups()
+    for (buffer_size, (forwarded_dups, removed_dups)) in zip(buffer_sizes, buffer_curve(glob_dups, buffer_sizes, Tii)):
+        print format_row(filename, Tii, buffer_size, forwarded_dups, removed_dups, total_dups)
+
+if __name__ == "__main__":
+    main()
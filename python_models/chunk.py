@@ -38,38 +38,151 @@ def n_i_to_cycle(n,i,Nn,Ni,Tnn,Tii,Tn,Ti):
     cycle = nnn*Nri + iii*Rnn + dnn*Hii + dii
     return cycle
 
-def chunk(weights,Nn,Ni,Tnn,Tii,Tn,Ti):
-    Nn, Ni = weights.shape
-
-    chunks = []
-    chunk_idx = []
+# n_i_to_cycle for arrays of n and i (broadcast against each other)
+def n_i_to_cycle_array(n,i,Nn,Ni,Tnn,Tii,Tn,Ti):
+    ii = np.asarray(i) // Ti
+    nn = np.asarray(n) // Tn
+    Rnn = int( math.ceil(min(Tnn,Nn+0.0)/Tn) )
+    Rii = int( math.ceil(min(Tii,Ni+0.0)/Ti) )
 
-    c=0
-    for nnn in range(0, Nn, Tnn):
-        for iii in range(0, Ni, Tii):
+    Nri = Ni/Ti
 
-            # one pass of NBout
-            for nn in range(nnn, min(nnn+Tnn,Nn), Tn):
+    # tile indicies (top left corner)
+    iii = ii // Rii * Rii
+    nnn = nn // Rnn * Rnn
 
-                rows = math.ceil( float(min(Tii, Ni-iii)) / Ti )
-                chunk = np.zeros((rows, Tn, Ti))
+    # height of this tile
+    Hii = np.minimum(Rii, Nri - iii)
 
-                # one pass of NBin
-                for ii in range(iii, min(iii+Tii,Ni), Ti):
+    # offsets within a tile
+    dnn = nn-nnn
+    dii = ii-iii
 
-                    # one row
-                    r = (ii-iii)/Ti
-                    for n in range(nn, min(nn+Tn,Nn), 1):
-                        cn = n-nn
-                        for i in range(ii, min(ii+Ti,Ni), 1):
-                            # sum[n] += synapse[n][i] * neuron[i]
-                            ci = i-ii
-                            chunk[r,cn,ci] = weights[n,i]
+    cycle = nnn*Nri + iii*Rnn + dnn*Hii + dii
+    return cycle
 
-                chunks.append(chunk)
+# cycle_table[n, i/Ti] = n_i_to_cycle(n,i,...) for every weight of a layer
+# tables are cached per layer shape and tiling
+cycle_tables = {}
+def cycle_table(Nn,Ni,Tnn,Tii,Tn,Ti):
+    key = (Nn,Ni,Tnn,Tii,Tn,Ti)
+    if (key not in cycle_tables):
+        n = np.arange(Nn)[:,None]
+        i = np.arange(0, Ni, Ti)[None,:]
+        table = n_i_to_cycle_array(n,i,Nn,Ni,Tnn,Tii,Tn,Ti)
+        cycle_tables[key] = table.astype(np.int32)
+    return cycle_tables[key]
+
+# schedule of the chunks in one layer, in execution order
+# returns:
+#   chunk_idx   list of (nn,iii) of the first weight in each chunk
+#   chunk_rows  number of rows (NBin passes) in each chunk
+def chunk_schedule(Nn,Ni,Tnn,Tii,Tn,Ti):
+    chunk_idx = []
+    chunk_rows = []
+    for nnn in range(0, Nn, Tnn):
+        for iii in range(0, Ni, Tii):
+            rows = int( math.ceil( float(min(Tii, Ni-iii)) / Ti ) )
+            for nn in range(nnn, min(nnn+Tnn,Nn), Tn):
                 chunk_idx.append((nn,iii))
+                chunk_rows.append(rows)
+    return (chunk_idx, chunk_rows)
+
+# gathers every chunk of a layer into one zero padded array
+# returns:
+#   tiles       num_chunks x R x Tn x Ti ndarray of weights.dtype, R is the longest chunk
+#               chunk c only uses rows [0,chunk_rows[c]), the rest are zero
+#   chunk_idx   list of (nn,iii) of each chunk in schedule order
+#   chunk_rows  number of rows in each chunk
+def tile(weights,Nn,Ni,Tnn,Tii,Tn,Ti):
+    Nn, Ni = weights.shape
+
+    (chunk_idx, chunk_rows) = chunk_schedule(Nn,Ni,Tnn,Tii,Tn,Ti)
+    R = max(chunk_rows)
+    cn = np.array([idx[0] for idx in chunk_idx], dtype=np.intp)
+    ci = np.array([idx[1] for idx in chunk_idx], dtype=np.intp)
+
+    if (Tnn % Tn == 0 and Tii % Ti == 0):
+        # tiles line up with the weights, pad and reshape
+        # weights -> [n block][i block][r][n][i]
+        nb = int( math.ceil( float(Nn) / Tn ) )
+        ib = int( math.ceil( float(Ni) / (R*Ti) ) )
+        padded = np.zeros((nb*Tn, ib*R*Ti), dtype=weights.dtype)
+        padded[:Nn,:Ni] = weights
+        blocks = padded.reshape(nb, Tn, ib, R, Ti).transpose(0,2,3,1,4)
+        tiles = blocks[cn/Tn, ci/(R*Ti)]
+    else:
+        # ragged tiles, the last row of an NBin pass can run past Tii
+        # gather each weight, out of range indices land on zero padding
+        padded = np.zeros((Nn+Tn, Ni+(R+1)*Ti), dtype=weights.dtype)
+        padded[:Nn,:Ni] = weights
+        r = np.arange(R)
+        n_idx = cn[:,None] + np.arange(Tn)[None,:]
+        i_idx = ci[:,None,None] + r[None,:,None]*Ti + np.arange(Ti)[None,None,:]
+        valid = r[None,:] < np.array(chunk_rows)[:,None]
+        i_idx[~valid] = padded.shape[1]-1
+        tiles = padded[n_idx[:,None,:,None], i_idx[:,:,None,:]]
+
+    return (tiles, chunk_idx, chunk_rows)
+
+# breaks weights into a list of R x Tn x Ti chunks
+# each chunk is a view into a single tiled array, chunks do not overlap
+def chunk(weights,Nn,Ni,Tnn,Tii,Tn,Ti):
+    (tiles, chunk_idx, chunk_rows) = tile(weights,Nn,Ni,Tnn,Tii,Tn,Ti)
+    chunks = [tiles[c,:rows] for (c,rows) in enumerate(chunk_rows)]
     return (chunks, chunk_idx)
 
+# yields (chunk, (nn,iii)) one chunk at a time in schedule order
+#   only one chunk is live at a time instead of a copy of the whole layer
+#   reuse: refill the same scratch array for every chunk, the consumer must
+#          be done with a chunk before asking for the next one
+def iter_chunks(weights,Nn,Ni,Tnn,Tii,Tn,Ti,reuse=False):
+    Nn, Ni = weights.shape
+
+    (chunk_idx, chunk_rows) = chunk_schedule(Nn,Ni,Tnn,Tii,Tn,Ti)
+    scratch = {} # rows -> scratch chunk
+
+    for ((nn,iii), rows) in zip(chunk_idx, chunk_rows):
+        if (reuse and rows in scratch):
+            chunk = scratch[rows]
+            chunk[:] = 0
+        else:
+            chunk = np.zeros((rows, Tn, Ti), dtype=weights.dtype)
+            if (reuse):
+                scratch[rows] = chunk
+
+        # weights covered by this chunk, row r holds inputs iii+r*Ti ...
+        ncols = min(rows*Ti, Ni-iii)
+        src = weights[nn:min(nn+Tn,Nn), iii:iii+ncols]
+        nrows = src.shape[0]
+        full = ncols/Ti
+        chunk[:full,:nrows,:] = src[:,:full*Ti].reshape(nrows, full, Ti).swapaxes(0,1)
+        if (ncols > full*Ti):
+            chunk[full,:nrows,:ncols-full*Ti] = src[:,full*Ti:]
+
+        yield (chunk, (nn,iii))
+
+# original position of every weight of an R x Tn x Ti chunk, one packed
+# code per weight: code = (r*Tn + n)*Ti + i
+#   int16 when every code fits, negative codes mark weights that have no
+#   original position any more (moved over or removed)
+def origin_index(R,Tn,Ti):
+    dtype = np.int16 if R*Tn*Ti-1 <= np.iinfo(np.int16).max else np.int32
+    return np.arange(R*Tn*Ti, dtype=dtype).reshape(R,Tn,Ti)
+
+# original (r,n,i) of the weight at (r,n,i), (c,c,c) for a negative code c
+def origin(ind, r, n, i):
+    code = int(ind[r,n,i])
+    if (code < 0):
+        return (code, code, code)
+    (R,Tn,Ti) = ind.shape
+    return (code / (Tn*Ti), code / Ti % Tn, code % Ti)
+
+# True if the weight at (r,n,i) is still in its original position
+def at_origin(ind, r, n, i):
+    (R,Tn,Ti) = ind.shape
+    return ind[r,n,i] == (r*Tn + n)*Ti + i
+
 # test program
 #Nn=256
 #Ni=1200
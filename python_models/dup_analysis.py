@@ -8,6 +8,7 @@ import math
 
 import read_filters
 import chunk
+import find_dups
 
 import look_for_replacement as re
 
@@ -73,6 +74,28 @@ def map_weight(w):
     else:
         return w
 
+# buffer key weight of a weight code, the float weight the csv printed
+#   the buffer dicts are keyed by the float weights the model was written
+#   for, so they hash and iterate in the same order and eviction ties (the
+#   first entry in dict order wins) go to the same victim as on floats
+def buffer_weight(code):
+    if (printed is None):
+        return map_weight(code)
+    return map_weight(printed[int(code) + code_offset])
+
+# printed[code + code_offset] is the float weight of every code in w
+# returns (printed, code_offset), printed is None if w holds floats
+def printed_weights(w, weights):
+    if (w.dtype.kind == 'f'):
+        return (None, 0)
+    (Nn, Ni) = w.shape
+    offset = 1 << (8*w.dtype.itemsize - 1)
+    printed = np.zeros(2*offset)
+    B = max(1, read_filters.block_weights / max(Ni,1))
+    for n0 in range(0, Nn, B):
+        printed[w[n0:n0+B].astype(np.int32).ravel() + offset] = np.asarray(weights[n0:n0+B]).ravel()
+    return (printed, offset)
+
 def my_hash(key):
     return key # hack, don't do anything
     (w,i) = key
@@ -219,7 +242,7 @@ def get_global_weight_idx(chunk_n, chunk_i, r, n, i):
 
 def calc_buffer_next_reuse(buffer, key):
     (kn,ki) = (buffer[key][0],key[1])
-    return chunk.n_i_to_cycle(kn,ki,Nn,Ni,Tnn,Tii,Tn,Ti)
+    return cycle_table[kn, ki/Ti]
 
 def process_weights(weights, weight_idx, lookaside, lookahead, out_limit, in_limit):
     chunk_n, chunk_i = weight_idx
@@ -285,59 +308,60 @@ def process_weights(weights, weight_idx, lookaside, lookahead, out_limit, in_lim
                 assert len(buffer[set][way].keys()) == len(next_c_dict[set][way].keys())
 
                 (gn,gi) = get_global_weight_idx(chunk_n, chunk_i, r, n, i)
+                bkey = (buffer_weight(weights[r,n,i]), gi)
                 # is this a duplicate?
-                if ( (w,gi) in glob_dups and len(glob_dups[(w,gi)]) > 1):
+                if ( glob_dups.group(w,gi) >= 0 ):
                     #if gi == 0:
                     #    print "dup: ", gn, gi, w
                     # is the product already in the buffer
                     found_way = -1
                     for tw in range(n_ways):
-                        if (w,gi) in buffer[set][tw]:
+                        if bkey in buffer[set][tw]:
                             found_way = tw
 
                     if found_way >= 0:
-                        if (gn not in buffer[set][found_way][(w,gi)]):
+                        if (gn not in buffer[set][found_way][bkey]):
                             continue # this product was forwarded by a previous operation
                         
-                        if gn != buffer[set][found_way][(w,gi)][0]:
-                            print "gn = %d but list[0] = %d" % (gn , buffer[set][found_way][(w,gi)][0])
+                        if gn != buffer[set][found_way][bkey][0]:
+                            print "gn = %d but list[0] = %d" % (gn , buffer[set][found_way][bkey][0])
 
                         # remove current key
-                        buffer[set][found_way][(w,gi)].remove(gn)
+                        buffer[set][found_way][bkey].remove(gn)
                         removed_dups += 1
                         # print "removed",w,gn,gi
                         # have all the duplicates been forwarded?
-                        if len(buffer[set][found_way][(w,gi)]) == 0:
+                        if len(buffer[set][found_way][bkey]) == 0:
                             # get rid of this entry in the buffer
                             #print "deleting", w, gi
-                            del buffer[set][found_way][(w,gi)]
-                            del next_c_dict[set][found_way][(w,gi)]
+                            del buffer[set][found_way][bkey]
+                            del next_c_dict[set][found_way][bkey]
                         else:
-                            next_c_dict[set][found_way][(w,gi)] = calc_buffer_next_reuse(buffer[set][found_way], (w,gi))
+                            next_c_dict[set][found_way][bkey] = calc_buffer_next_reuse(buffer[set][found_way], bkey)
                     else:
                         # product is not stored in the buffer
 
                         # will this product be reused?
-                        nidx = glob_dups[(w,gi)].index(gn) 
-                        if ( nidx == len(glob_dups[(w,gi)])-1 ):
+                        g = glob_dups.group(w,gi)
+                        nidx = glob_dups.index(g,gn)
+                        if ( glob_dups.next(g,nidx) < 0 ):
                             # last duplicate in list, don't save
                             continue
 
                         # get the remaining duplicates
-                        dups = list(glob_dups[(w,gi)][nidx+1:])
+                        dups = glob_dups.remaining(g,nidx+1)
                         # can the duplicates be forwarded this cycle?
-                        dups_copy = list(dups)
-                        for d in dups_copy:
-                            # duplicates issued this cycle:
-                            if gn/Tn == d/Tn:
-                                forwarded_dups += 1
-                                removed_dups += 1
-                                # remove from global dups list 
-                                glob_dups[(w,gi)].remove(d)
-                                dups.remove(d)
-                                #print 'forward', w, gi, d 
-                                weights[r, d % Tn ,i] = 0
-                                #print 'forward', w, gi, gn, '->', d
+                        # duplicates issued this cycle are in gn's tile
+                        n_max = (gn/Tn+1)*Tn
+                        for d in dups[dups < n_max]:
+                            forwarded_dups += 1
+                            removed_dups += 1
+                            #print 'forward', w, gi, d 
+                            weights[r, d % Tn ,i] = 0
+                            #print 'forward', w, gi, gn, '->', d
+                        # remove from global dups list 
+                        glob_dups.consume(g, n_max)
+                        dups = dups[dups >= n_max].tolist()
 
                         if ( len(dups) == 0 ):
                             # all duplicates forwarded
@@ -368,7 +392,7 @@ def process_weights(weights, weight_idx, lookaside, lookahead, out_limit, in_lim
 #                            print "n =",gn, "evicting", buffer[victim_key]
 
                             # if victim has longer reuse than the current dup, replace it
-                            replacement_c = chunk.n_i_to_cycle(dups[0], gi, Nn, Ni,Tnn,Tii,Tn,Ti)
+                            replacement_c = cycle_table[dups[0], gi/Ti]
                             if (victim_c > replacement_c):
                                 #print "deleting", victim_key[0], victim_key[1]
                                 del buffer[set][way][victim_key]
@@ -379,10 +403,10 @@ def process_weights(weights, weight_idx, lookaside, lookahead, out_limit, in_lim
                         # add buffer entry
                         #print "adding", w, gi
                         #dups.pop(0)
-                        buffer[set][way][(w,gi)] = dups
+                        buffer[set][way][bkey] = dups
                         #if gi == 0:
                         #    print "adding dups to buffer", dups 
-                        next_c_dict[set][way][my_hash((w,gi))] = calc_buffer_next_reuse(buffer[set][way], (w,gi))
+                        next_c_dict[set][way][my_hash(bkey)] = calc_buffer_next_reuse(buffer[set][way], bkey)
                         glob_max_buffer_size = max(glob_max_buffer_size, len(buffer[set][way].keys()))
                                 
                         
@@ -552,14 +576,17 @@ Tn=16
 Tnn=1024
 
 #print "read filter file"
-# w is an Nn x Ni ndarray of weights
-w = read_filters.read_filters(filename)
+# w is an Nn x Ni ndarray of fixed point weight codes, weights = w * scale
+(w, scale) = read_filters.read_codes(filename)
 (Nn, Ni) = w.shape
+(printed, code_offset) = printed_weights(w, read_filters.read_filters(filename))
+
+# cycle_table[n, i/Ti] is the cycle weight (n,i) is processed in
+cycle_table = chunk.cycle_table(Nn,Ni,Tnn,Tii,Tn,Ti)
 
 #print w.shape
 
 glob_weights = w
-glob_dups = {}
 glob_max_buffer_size = 0
 
 total_dups = 0
@@ -571,70 +598,21 @@ buffer = [[{} for i in range(n_ways)] for j in range(n_sets)]
 next_c_dict = [[{} for i in range(n_ways)] for j in range(n_sets)]
 
 # generate list of all duplicates in filter
-add = 0
-for nnn in range(0, Nn, Tnn):
-    for iii in range(0, Ni, Tii):
-        for nn in range(nnn, min(nnn+Tnn,Nn), Tn):
-            for ii in range(iii, min(iii+Tii,Ni), Ti):
-                for n in range(nn, min(nn+Tn,Nn), 1):
-                    for i in range(ii, min(ii+Ti,Ni), 1):
-                        weight = map_weight(w[n,i])
-                        if (weight == 0):
-                            continue
-                        if ( not (weight,i) in glob_dups ):
-                            glob_dups[(weight,i)] = []
-                        else:
-                            add += 1
-                            #print "add",weight,n,i
-
-                        # should I append time instead?
-                        glob_dups[(weight,i)].append(n)
-
-#for i in range(Ni):
-#    for n in range(Nn):
-#        weight = map_weight(w[n,i])
-#        if (weight == 0):
-#            continue
-#        if ( not (weight,i) in glob_dups ):
-#            glob_dups[(weight,i)] = []
-#        else:
-#            add += 1
-#            #print "add",weight,n,i
-#
-#        # should I append time instead?
-#        glob_dups[(weight,i)].append(n)
-#
-
-# sort n_list by to reuse time
-diff_list = []
-for k in glob_dups.keys():
-    (kw,ki) = k
-    n_list = glob_dups[k]
-    if (len(n_list) == 1):
-        del glob_dups[k]
-        continue
-    reuse_cycle = [chunk.n_i_to_cycle(n,ki,Nn,Ni,Tnn,Tii,Tn,Ti) for n in n_list]
-    for rc in range(0,len(reuse_cycle)-1):
-        if reuse_cycle[rc] != reuse_cycle[rc+1]:
-            diff = reuse_cycle[rc+1] - reuse_cycle[rc]
-            diff_list.append(diff)
-#    print ki, n_list
-#    print reuse_cycle
-#    glob_dups[k] = [n for (c,n) in sorted(zip(reuse_cycle,n_list), key=lambda pair: pair[0])]
+# find_dups groups them with numpy, n's are in execution order
+glob_dups = find_dups.DupGroups(w, negatives_are_dups)
 
+# time between reuses, reuse_hist.py bins these for every layer
+diff_list = find_dups.reuse_distances(glob_dups, cycle_table, Ti)
 
 #print "mean buffer time", sum(diff_list)/float(len(diff_list))
-for key in glob_dups:
-#    print key, len(glob_dups[key]), glob_dups[key]
-    total_dups += len(glob_dups[key])-1
-#        print key, glob_dups[key]
-#print "break into chunks"
-# chunks is a list of Nrows * Tn * Ti weights
-(chunks, chunk_idxs) = chunk.chunk(w,Nn,Ni,Tnn,Tii,Tn,Ti)
+total_dups = glob_dups.total_dups()
+
 
+#print "break into chunks"
 #print "processing each chunk"
+# chunks of Nrows * Tn * Ti weights are streamed one at a time
 np.set_printoptions(threshold=np.inf)
-for (c, c_idx) in zip(chunks, chunk_idxs):
+for (c, c_idx) in chunk.iter_chunks(w,Nn,Ni,Tnn,Tii,Tn,Ti,reuse=True):
     process_weights(c, c_idx, lookaside, lookahead, out_limit, in_limit)
 
 left=0
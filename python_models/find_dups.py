@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# finds the duplicate weights of a layer
+#   weights (n,i) and (n',i) are duplicates if they have the same value,
+#   or magnitude if negatives are dups, they multiply the same input i so
+#   only one of the products has to be computed
+#
+# duplicates are returned in CSR form, one group per (value, i):
+#   values[g], inputs[g]            weight value and input of group g
+#   ns[offsets[g]:offsets[g+1]]     the n of each weight in group g
+# zeros and groups with a single weight are dropped
+
+import numpy as np
+
+# inputs are sorted this many weights at a time
+block_weights = 1 << 22
+
+# for a fixed input i the weights are processed in increasing n
+# (n_i_to_cycle is nondecreasing in n), so each group's ns are sorted
+# by n, which is the order the duplicates are issued in
+def find_dups(w, absolute=True):
+    (Nn, Ni) = w.shape
+    v = np.abs(w) if absolute else w
+    B = max(1, block_weights / Nn)
+
+    values = []
+    inputs = []
+    lengths = []
+    ns = []
+    for i0 in range(0, Ni, B):
+        i1 = min(i0 + B, Ni)
+        (b_values, b_inputs, b_lengths, b_ns) = find_dups_block(v[:, i0:i1].T, i0)
+        values.append(b_values)
+        inputs.append(b_inputs)
+        lengths.append(b_lengths)
+        ns.append(b_ns)
+
+    lengths = np.concatenate(lengths)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return (np.concatenate(values), np.concatenate(inputs), offsets, np.concatenate(ns))
+
+# groups one block of inputs
+#   vt  (inputs, Nn) weights of inputs i0, i0+1, ...
+def find_dups_block(vt, i0):
+    (I, Nn) = vt.shape
+
+    # stable sort of each input's weights, equal weights stay in n order
+    order = np.argsort(vt, axis=1, kind='mergesort')
+    sv = vt[np.arange(I)[:,None], order].ravel()
+    sn = order.ravel()
+
+    # runs of equal weights within an input
+    start = np.ones(I*Nn, dtype=bool)
+    start[1:] = sv[1:] != sv[:-1]
+    start[::Nn] = True
+    starts = np.flatnonzero(start)
+    lengths = np.diff(np.append(starts, I*Nn))
+
+    keep = (lengths > 1) & (sv[starts] != 0)
+    member = np.repeat(keep, lengths)
+    starts = starts[keep]
+    lengths = lengths[keep]
+
+    return (sv[starts], (i0 + starts / Nn).astype(np.int32), lengths, sn[member].astype(np.int32))
+
+# duplicate groups of a layer
+#   groups are numbered in (i, value) order, group g holds the sorted ns
+#   ns[offsets[g]:offsets[g+1]] and a cursor, ns before it were consumed
+#   about 4 bytes per duplicate weight instead of a dict of python lists
+class DupGroups:
+
+    def __init__(self, w, absolute=True):
+        (self.values, self.inputs, self.offsets, self.ns) = find_dups(w, absolute)
+        # groups of input i are in_offsets[i]:in_offsets[i+1]
+        self.in_offsets = np.searchsorted(self.inputs, np.arange(w.shape[1]+1))
+        self.cursor = self.offsets[:-1].copy()
+
+    # number of groups
+    def __len__(self):
+        return len(self.values)
+
+    # number of duplicates, not counting the first weight of each group
+    def total_dups(self):
+        return len(self.ns) - len(self.values)
+
+    # group of weight value v at input i, -1 if v has no duplicates at i
+    def group(self, v, i):
+        (a, b) = (self.in_offsets[i], self.in_offsets[i+1])
+        g = a + self.values[a:b].searchsorted(v)
+        if (g < b and self.values[g] == v):
+            return g
+        return -1
+
+    # slot of n in group g, -1 if n is not in it
+    def index(self, g, n):
+        (a, b) = (self.offsets[g], self.offsets[g+1])
+        s = a + self.ns[a:b].searchsorted(n)
+        if (s < b and self.ns[s] == n):
+            return s
+        return -1
+
+    # slot of the next duplicate after slot s of group g, -1 if s is the last
+    def next(self, g, s):
+        s = max(s+1, self.cursor[g])
+        if (s < self.offsets[g+1]):
+            return s
+        return -1
+
+    # ns of group g from slot s on that are >= n_min and not consumed
+    def remaining(self, g, s, n_min=0):
+        (a, b) = (max(s, self.cursor[g]), self.offsets[g+1])
+        a += self.ns[a:b].searchsorted(n_min)
+        return self.ns[a:b]
+
+    # marks the ns of group g before n_max as consumed
+    def consume(self, g, n_max):
+        (a, b) = (self.cursor[g], self.offsets[g+1])
+        self.cursor[g] = a + self.ns[a:b].searchsorted(n_max)
+
+# cycles between consecutive duplicates of each group
+#   duplicates issued in the same cycle are forwarded, not buffered, so
+#   zero distances are dropped
+#   cycle_table     chunk.cycle_table of the layer
+def reuse_distances(dups, cycle_table, Ti):
+    lengths = np.diff(dups.offsets)
+    reuse_cycle = cycle_table[dups.ns, np.repeat(dups.inputs, lengths)/Ti]
+    diff = np.diff(reuse_cycle)
+    diff[dups.offsets[1:-1]-1] = 0 # don't diff across lists
+    return diff[diff != 0]
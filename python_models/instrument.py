@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# opt-in per phase timers and counters for the models
+#   enabled by setting INSTRUMENT to a file name in the environment, e.g.
+#   INSTRUMENT=results.json python bubble_up_rm_dup.py ...
+#   then write_row appends one JSON object per result row to that file:
+#   {"row": ..., "timers": {phase: [seconds, calls]}, "counters": {name: n},
+#    "hists": {name: {value: n}}} with what was measured since the last take
+#
+#   disabled, timed() leaves functions undecorated, timer() returns a shared
+#   no-op context and the other calls return at once. hot loops test
+#   instrument.enabled before calling count()
+#
+#   with instrument.timer('build_dups'):   time a block
+#   @instrument.timed('process_chunk')      time every call of a function
+#   instrument.count('buffer_hits')         add to a counter
+#   instrument.hist('change_iterations', k) count how often a value occurs
+
+import os
+import time
+import json
+import functools
+
+sidecar = os.environ.get('INSTRUMENT')
+enabled = bool(sidecar)
+
+timers = {}     # phase -> [seconds, calls]
+counters = {}   # name -> count
+hists = {}      # name -> {value: count}
+
+class NullTimer:
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+null_timer = NullTimer()
+
+class Timer:
+    def __init__(self, name):
+        self.name = name
+    def __enter__(self):
+        self.start = time.time()
+        return self
+    def __exit__(self, *exc):
+        t = timers.setdefault(self.name, [0.0, 0])
+        t[0] += time.time() - self.start
+        t[1] += 1
+        return False
+
+# context manager that adds the time spent in its block to phase name
+def timer(name):
+    if (not enabled):
+        return null_timer
+    return Timer(name)
+
+# decorator that adds the time of every call to phase name
+#   disabled, the function is returned as is, so decorating a hot function
+#   costs nothing unless INSTRUMENT is set when the module is imported
+def timed(name):
+    def wrap(f):
+        if (not enabled):
+            return f
+        @functools.wraps(f)
+        def call(*args, **kwargs):
+            with Timer(name):
+                return f(*args, **kwargs)
+        return call
+    return wrap
+
+def count(name, n=1):
+    if (enabled):
+        counters[name] = counters.get(name, 0) + n
+
+def hist(name, value):
+    if (enabled):
+        h = hists.setdefault(name, {})
+        h[value] = h.get(value, 0) + 1
+
+def reset():
+    timers.clear()
+    counters.clear()
+    hists.clear()
+
+# the timers, counters and histograms since the last take, then starts over
+def take():
+    profile = dict(timers=dict(timers), counters=dict(counters),
+                   hists=dict( (name, dict( (str(v), c) for (v, c) in h.items() )) for (name, h) in hists.items() ))
+    reset()
+    return profile
+
+# appends a result row to the sidecar with profile (default: take()) and any
+# other fields (script, params) it belongs to
+def write_row(row, profile=None, **fields):
+    if (not enabled):
+        return
+    rec = dict(fields, row=row)
+    rec.update(profile or take())
+    f = open(sidecar, 'a')
+    f.write(json.dumps(rec, sort_keys=True) + "\n")
+    f.close()
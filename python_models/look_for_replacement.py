@@ -8,6 +8,7 @@ import math
 
 import read_filters
 import chunk
+import instrument
 
 def is_zero(w):
     return not w.any()
@@ -15,7 +16,37 @@ def is_zero(w):
 def zero():
     return 0
 
-def look_for_replacement(r, n, i, weights, ind, lookaside, lookahead):
+# nonzero weights of each (n,i) lane of a chunk, counted over its rows
+#   count[n,i,r] is the number of nonzero weights in weights[:r,n,i], so lane
+#   (n,i) holds count[n,i,rmax+1] - count[n,i,r+1] weights in rows r+1..rmax
+#   weights are only ever moved up into the row being filled or zeroed, so
+#   the counts never miss a weight below that row. replace keeps them up to
+#   date, weights zeroed anywhere else are dropped when find_replacement
+#   probes them
+class LaneCounts:
+
+    def __init__(self, weights):
+        (R,Tn,Ti) = weights.shape
+        self.count = np.zeros((Tn,Ti,R+1), dtype=np.int32)
+        np.cumsum((weights != 0).transpose(1,2,0), axis=2, out=self.count[:,:,1:])
+
+    # first row in r+1..rmax with a weight in lane (n,i), None if there is none
+    def first(self, r, rmax, n, i):
+        lane = self.count[n,i]
+        if (lane[rmax+1] == lane[r+1]):
+            return None
+        return int(lane.searchsorted(lane[r+1]+1)) - 1
+
+    # weight (r,n,i) was zeroed
+    def remove(self, r, n, i):
+        self.count[n,i,r+1:] -= 1
+
+# position (rr,ri) of the weight that fills the bubble at (r,n,i)
+# returns None if there is no replacement in the window
+#   with the LaneCounts of the chunk empty lanes are skipped and the search
+#   goes straight to the first nonzero row of a lane
+@instrument.timed('find_replacement')
+def find_replacement(r, n, i, weights, lookaside, lookahead, counts=None):
 
     # get dimensions 
     (R,Tn,Ti) = weights.shape
@@ -30,14 +61,42 @@ def look_for_replacement(r, n, i, weights, ind, lookaside, lookahead):
             d *= -1
         ri = i + d
         ri = ri % 16 # wrap around
+        if (counts is not None):
+            rr = counts.first(r, rmax, n, ri)
+            while (rr is not None):
+                if (instrument.enabled):
+                    instrument.count('replacement_probes')
+                if (not is_zero(weights[rr,n,ri])):
+                    return (rr, ri)
+                # zeroed since the counts were taken
+                counts.remove(rr, n, ri)
+                rr = counts.first(rr, rmax, n, ri)
+            continue
         # lookahead
         for rr in range( r + 1 , rmax + 1 ):
+            if (instrument.enabled):
+                instrument.count('replacement_probes')
             if (not is_zero(weights[rr,n,ri])):
                 # found a replacement
-                weights[r,n,i] = weights[rr,n,ri]
-                weights[rr,n,ri] = zero()
-                ind[r,n,i] = ind[rr,n,ri]
-                ind[rr,n,i] = -1
-                return (weights, ind, 1)
+                return (rr, ri)
+
+    return None
+
+# moves weight (rr,n,ri) into the bubble at (r,n,i)
+def replace(r, n, i, rr, ri, weights, ind, counts=None):
+    weights[r,n,i] = weights[rr,n,ri]
+    weights[rr,n,ri] = zero()
+    ind[r,n,i] = ind[rr,n,ri]
+    ind[rr,n,i] = -1
+    if (counts is not None):
+        counts.remove(rr, n, ri)
+
+def look_for_replacement(r, n, i, weights, ind, lookaside, lookahead, counts=None):
+
+    found = find_replacement(r, n, i, weights, lookaside, lookahead, counts)
+    if (found is None):
+        return (weights, ind, 0)
 
-    return (weights, ind, 0)
+    (rr, ri) = found
+    replace(r, n, i, rr, ri, weights, ind, counts)
+    return (weights, ind, 1)
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# OPT (Belady) stack distances
+#   Mattson et al.'s priority stack: the priority of an entry is the time of
+#   its next reference, the top C entries of the stack are the contents of
+#   an OPT cache of C entries. a reference found at depth d hits in every
+#   cache of d or more entries, so a single pass over the reference stream
+#   gives the hit counts of every cache size
+#
+# the caches bypass: a referenced entry is only kept if it is reused before
+# the entry it would evict, like buffer_insert. so on a reference to x at
+# depth d (or a miss) x is carried down from the top with its new priority,
+# at each position the entry with the later next reference is carried on and
+# the other one stays. only the prefix maxima of next reference time
+# (records) move, each one to the position of the next record, the last one
+# fills d
+
+import numpy as np
+
+# index of the next reference to the same key, len(keys) if there is none
+def next_refs(keys):
+    order = np.argsort(keys, kind='mergesort')
+    nxt = np.empty(len(keys), dtype=np.int64)
+    nxt[order[:-1]] = order[1:]
+    last = np.ones(len(keys), dtype=bool)
+    last[:-1] = keys[order[1:]] != keys[order[:-1]]
+    nxt[order[last]] = len(keys)
+    return nxt
+
+# inputs:
+#   keys        reference stream, ints in [0, max(keys)]
+#   next_ref    next_refs(keys) or any other next reference time
+#   depth       deepest stack position tracked, entries below it are dropped
+# returns:
+#   dist        1 based stack distance of each reference, 0 if it misses in
+#               a cache of depth entries
+def stack_distances(keys, next_ref, depth):
+    dist = np.zeros(len(keys), dtype=np.int32)
+    if (len(keys) == 0):
+        return dist
+    stack_key = np.zeros(depth, dtype=np.int64)
+    stack_nu = np.zeros(depth, dtype=np.int64)
+    pos = np.full(int(keys.max())+1, -1, dtype=np.int64)
+    size = 0
+
+    for (t, (x, nu)) in enumerate(zip(keys.tolist(), next_ref.tolist())):
+        d = pos[x]
+        end = d if d >= 0 else size
+
+        # x and the records above it, each moves down to the next one
+        seg = stack_nu[:end]
+        running = np.maximum.accumulate(np.append(nu, seg))
+        rec = np.flatnonzero(seg > running[:-1])
+        dest = np.append(rec, end)
+        moved = np.append(x, stack_key[rec])
+        moved_nu = np.append(nu, stack_nu[rec])
+        if (end == depth):
+            # the last one falls off the stack
+            pos[moved[-1]] = -1
+            (dest, moved, moved_nu) = (dest[:-1], moved[:-1], moved_nu[:-1])
+        stack_key[dest] = moved
+        stack_nu[dest] = moved_nu
+        pos[moved] = dest
+
+        if (d >= 0):
+            dist[t] = d + 1
+        elif (size < depth):
+            size += 1
+
+    return dist
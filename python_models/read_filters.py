@@ -2,6 +2,8 @@
 
 import math
 import sys
+import os
+import tempfile
 import numpy as np
 
 def is_number(s):
@@ -11,39 +13,222 @@ def is_number(s):
     except ValueError:
         return False
 
-def read_filters(filename):
+# converts one line of comma separated values to an array
+def parse_line(line, dtype):
+    entries = line.split(',')
+    # drop the newline after the trailing comma
+    if (not is_number(entries[-1])):
+        entries.pop()
+    try:
+        return np.array(entries, dtype=dtype)
+    except ValueError:
+        return np.array([float(e) for e in entries if is_number(e)], dtype=dtype)
+
+# streams a csv of filters into a preallocated Nn x Ni array
+#   filters are separated by a "filter" line or a blank line
+#   the first filter sets Ni, the array grows if the file has more filters
+#   than estimated from its size
+def parse_filters(filename, dtype=np.float64):
 
     file = open(filename)
-    lines = file.readlines()
-
-    filter_list = []
-    filt = []
-
-    for line in lines:
-        if (line.strip() != ""):
-            if (line.find("filter") >= 0):
-                if (len(filt)):
-                    filter_list.append(filt)
-                    filt = []
-            else:
-                entries = line.split(',')
-                for e in entries:
-                    if (is_number(e)):
-                        filt.append(float(e))
-        else:
-            # blank line: 
-            if (len(filt)):
-                filter_list.append(filt)
-                filt = []
+    file_size = os.fstat(file.fileno()).st_size
 
-    if (len(filt)):
-        filter_list.append(filt)
-        filt = []
+    weights = None
+    first = []      # rows of the first filter, before Ni is known
+    first_bytes = 0
+    n = 0           # current filter
+    col = 0         # next entry of the current filter
 
-    Nn = len(filter_list)
-    Ni = len(filter_list[0])
+    for line in file:
+        if (line.strip() != "" and line.find("filter") < 0):
+            row = parse_line(line, dtype)
+            if (not len(row)):
+                continue
+            if (weights is None):
+                first.append(row)
+                first_bytes += len(line)
+                continue
+            if (n >= weights.shape[0]):
+                weights.resize((2*weights.shape[0], Ni), refcheck=False)
+            if (col + len(row) > Ni):
+                raise ValueError("%s: filter %d has more than %d weights" % (filename, n, Ni))
+            weights[n, col:col+len(row)] = row
+            col += len(row)
+            continue
 
+        # "filter" or blank line: end of the current filter
+        if (weights is None):
+            if (len(first)):
+                f = np.concatenate(first)
+                Ni = len(f)
+                est = max(1, int( math.ceil( float(file_size) / max(first_bytes,1) ) ) + 1)
+                weights = np.empty((est, Ni), dtype=dtype)
+                weights[0] = f
+                n = 1
+                col = 0
+                first = []
+        elif (col):
+            if (col != Ni):
+                raise ValueError("%s: filter %d has %d weights, expected %d" % (filename, n, col, Ni))
+            n += 1
+            col = 0
 
-    weights = np.array(filter_list)
+    file.close()
+
+    if (weights is None):
+        # the whole file is one filter
+        weights = np.concatenate(first).reshape(1,-1)
+        n = 1
+    elif (col):
+        if (col != Ni):
+            raise ValueError("%s: filter %d has %d weights, expected %d" % (filename, n, col, Ni))
+        n += 1
+
+    # trim the estimate in place
+    weights.resize((n, weights.shape[1]), refcheck=False)
     return weights
 
+# path of the binary copy of filename's weights
+#   kept in a hidden directory next to the csv so filter globs don't pick it up
+#   keyed by size and mtime so an edited csv is parsed again
+def sidecar_name(filename, dtype):
+    st = os.stat(filename)
+    (d, f) = os.path.split(os.path.abspath(filename))
+    return os.path.join(d, ".npy_cache", "%s.%s.%d.%d.npy" %
+                        (f, np.dtype(dtype).name, st.st_size, int(st.st_mtime)))
+
+# reads a csv of filters
+#   returns an Nn x Ni ndarray of weights
+#   with cache, the parsed weights are saved next to the csv and later calls
+#   memory map them (read only) instead of parsing the csv again
+def read_filters(filename, dtype=np.float64, cache=True):
+
+    if (not cache):
+        return parse_filters(filename, dtype)
+
+    sidecar = sidecar_name(filename, dtype)
+    if (os.path.exists(sidecar)):
+        try:
+            return np.load(sidecar, mmap_mode='r')
+        except (IOError, ValueError):
+            pass # corrupt sidecar, parse again
+
+    weights = parse_filters(filename, dtype)
+
+    # write to a temp file and rename so concurrent jobs never see a partial file
+    tmp = None
+    try:
+        if (not os.path.isdir(os.path.dirname(sidecar))):
+            os.makedirs(os.path.dirname(sidecar))
+        (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(sidecar))
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, weights)
+        # mkstemp creates the file 0600, give it the mode of any file created
+        # under the umask so others sharing the filter tree can read it
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp, 0666 & ~umask)
+        os.rename(tmp, sidecar)
+    except (IOError, OSError):
+        # read only filter dir or full disk, don't cache
+        if (tmp is not None and os.path.exists(tmp)):
+            os.remove(tmp)
+        return weights
+
+    return np.load(sidecar, mmap_mode='r')
+
+# rows of weights converted at a time by fixed_point
+block_weights = 1 << 22
+
+# csvs print weights with 6 decimals, so a printed weight is up to half a
+# unit of the last decimal off its fixed point value
+print_precision = 0.5e-6
+
+# exponent of the lowest set bit of every nonzero weight, None if all are zero
+def lowest_bit(weights):
+    (Nn, Ni) = weights.shape
+    B = max(1, block_weights / max(Ni,1))
+    lsb = None
+    for n0 in range(0, Nn, B):
+        w = np.asarray(weights[n0:n0+B], dtype=np.float64)
+        w = w[w != 0]
+        if (not len(w)):
+            continue
+        if (not np.isfinite(w).all()):
+            raise ValueError("weights are not finite")
+        (m, e) = np.frexp(w)
+        mant = (np.abs(m) * 2.0**53).astype(np.int64)
+        (_, low) = np.frexp( (mant & -mant).astype(np.float64) )
+        b = (e - 53 + low - 1).min()
+        lsb = b if lsb is None else min(lsb, b)
+    return lsb
+
+# largest power of two step that every weight is within print_precision of
+# a multiple of, the quantization step of a printed fixed point layer
+#   steps up to twice the precision fit any weights, they are not tried
+# raises ValueError if there is no such step
+def printed_step(weights):
+    (Nn, Ni) = weights.shape
+    B = max(1, block_weights / max(Ni,1))
+    smallest = min( np.abs(w[w != 0]).min() if (w != 0).any() else np.inf
+                    for w in (np.asarray(weights[n0:n0+B], dtype=np.float64) for n0 in range(0, Nn, B)) )
+
+    # slack for the rounding of the parsed decimal
+    tolerance = print_precision * (1 + 1e-9)
+    k = int(math.floor(math.log(smallest + print_precision, 2)))
+    while (2.0**k > 2*print_precision):
+        step = 2.0**k
+        for n0 in range(0, Nn, B):
+            w = np.asarray(weights[n0:n0+B], dtype=np.float64)
+            if (np.abs(np.rint(w / step) * step - w).max() > tolerance):
+                break
+        else:
+            return step
+        k -= 1
+    raise ValueError("weights are not fixed point to %g" % print_precision)
+
+# fixed point codes of weights
+#   scale is the largest power of two that divides every weight, so
+#   weights = codes * scale exactly and equal weights have equal codes
+#   weights read from a csv with 6 decimals are not exact multiples of their
+#   step, then scale is the printed_step and codes are the nearest multiples
+#   codes are int8 if they fit in [-127,127] (so abs() can't overflow),
+#   int16 otherwise
+# returns (codes, scale)
+# raises ValueError if the weights need more than 16 bits
+def fixed_point(weights):
+    (Nn, Ni) = weights.shape
+    B = max(1, block_weights / max(Ni,1))
+
+    lsb = lowest_bit(weights)
+    if (lsb is None):
+        return (np.zeros((Nn, Ni), dtype=np.int8), 1.0)
+
+    top = np.abs(np.asarray(weights)).max()
+    scale = 2.0**lsb
+    if (top / scale > 32767):
+        scale = printed_step(weights)
+
+    top = round(top / scale)
+    if (top <= 127):
+        dtype = np.int8
+    elif (top <= 32767):
+        dtype = np.int16
+    else:
+        raise ValueError("weights need %d bits of fixed point" % (int(math.log(top,2))+2))
+
+    codes = np.empty((Nn, Ni), dtype=dtype)
+    for n0 in range(0, Nn, B):
+        codes[n0:n0+B] = np.rint(np.asarray(weights[n0:n0+B], dtype=np.float64) / scale)
+    return (codes, scale)
+
+# reads a csv of filters as fixed point codes
+#   returns (codes, scale), weights = codes * scale
+#   weights that are not fixed point in 16 bits (to the printed precision)
+#   are returned as floats with scale 1 so the models still run on them
+def read_codes(filename, cache=True):
+    weights = read_filters(filename, cache=cache)
+    try:
+        return fixed_point(weights)
+    except ValueError:
+        return (weights, 1.0)
@@ -9,6 +9,8 @@ import numpy as np
 
 from os.path import basename
 
+import results_db
+
 np.set_printoptions(precision=4)
 
 def insert_unique(l, n):
@@ -24,19 +26,25 @@ script = args.pop(0)
 global precision
 files = args
 
-if ( not ".csv" in files[0] ):
-    files = glob.glob( files[0] + '/*.csv' )
+# results store: read_results.py <results.db> <batch> <x> <n> <y_redux> <y>
+#   x, n, y_redux and y are results_db column names, x and n can be '-'
+db_file = None
+if ( files[0].endswith(".db") ):
+    (db_file, batch_name, x_name, n_name, y_redux_name, y_name) = files
+else:
+    if ( not ".csv" in files[0] ):
+        files = glob.glob( files[0] + '/*.csv' )
 
-file = open('net_names.txt')
+    file = open('net_names.txt')
 
-net_names = [re.sub(".csv","",(basename(w))) for w in files]
-print net_names
+    net_names = [re.sub(".csv","",(basename(w))) for w in files]
+    print net_names
 
-try:
-    batch_name = files[0].split("/")[1] # results/<batch>/<script>-<config>/<net>.csv
-except IndexError as e:
-    print e, "files[0] =", files[0]
-precision = batch_name.split('_')[-1]
+    try:
+        batch_name = files[0].split("/")[1] # results/<batch>/<script>-<config>/<net>.csv
+    except IndexError as e:
+        print e, "files[0] =", files[0]
+precision = results_db.batch_precision(batch_name)
 
 x_vals = []
 n_vals = []
@@ -136,72 +144,82 @@ elif ('broadcast_bus_scaling' in batch_name):
 else:
     print "Warning, using default indicies"
 
-# read files into data_dict
-# data_dict[net][x][n] = [list of layer lines]
-data_dict = {}
-# for each network
-for f in range(0,len(files)):
-    file = open(files[f])
-    lines = file.readlines()
-    net = net_names[f]
-    data_dict[net] = {}
-
-    # for each layer in network
-    for line in lines:
-        cols = line.split(',')
-        if (x_col >= 0):
-            x = int(cols[x_col])
-        else:
-            x=0
-        if (n_col >= 0):
-            n = int(cols[n_col])
-        else:
-            n=0
-        if not x in data_dict[net]:
-            data_dict[net][x] = {}
-        if not n in data_dict[net][x]:
-            data_dict[net][x][n] = []
-        data_dict[net][x][n].append(line)
-
-x_vals = data_dict[net_names[0]].keys()
-x_vals.sort()
-print "x vals =", x_vals
-n_vals = data_dict[ net_names[0] ][ x_vals[0] ].keys()
-n_vals.sort()
-print "n vals =", n_vals
-x_size = len(x_vals)
-n_size = len(n_vals)
-num_nets = len(net_names)
-
-
-# convert dict to ndarray
-
-y_rel = np.zeros( (x_size, n_size, num_nets) )
-for f, net in enumerate(net_names):
-    for xi, x in enumerate(x_vals):
-        for ni, n in enumerate(n_vals):
-            y = []
-            y_redux = []
-            r = []
-            for layer in data_dict[net][x][n]:
-                cols = layer.split(',')
-                y.append(       float(  cols[y_col]         ))
-                y_redux.append( float(  cols[y_redux_col]   ))
-                r.append(       int(    cols[total_row_col] ))
-            y = np.array(y)
-            y_redux = np.array(y_redux)
-            r = np.array(r)
-
-            # row reduction
-            y_rel [xi,ni,f] = y_redux.sum() / y.sum()
-
-            # stat per row
-            #y_redux [xi,ni,f] = y.sum() / r.sum() 
-
-            # weigh by number of rows
-            #y_rel [xi,ni,f] = np.sum( np.multiply(y,r) / r.sum() )
-#    print net_names[f]
-#    print y_rel [:,:,f]
+if (db_file):
+    # sum over layers of each net straight from the store
+    none = lambda c: None if c == '-' else c
+    db = results_db.connect(db_file)
+    (x_vals, n_vals, net_names, y_rel) = results_db.ratio_table(db, none(x_name), none(n_name),
+                                                 y_redux_name, y_name, batch=batch_name)
+    x_label = x_name
+    n_label = n_name
+    y_label = y_redux_name
+else:
+    # read files into data_dict
+    # data_dict[net][x][n] = [list of layer lines]
+    data_dict = {}
+    # for each network
+    for f in range(0,len(files)):
+        file = open(files[f])
+        lines = file.readlines()
+        net = net_names[f]
+        data_dict[net] = {}
+
+        # for each layer in network
+        for line in lines:
+            cols = line.split(',')
+            if (x_col >= 0):
+                x = int(cols[x_col])
+            else:
+                x=0
+            if (n_col >= 0):
+                n = int(cols[n_col])
+            else:
+                n=0
+            if not x in data_dict[net]:
+                data_dict[net][x] = {}
+            if not n in data_dict[net][x]:
+                data_dict[net][x][n] = []
+            data_dict[net][x][n].append(line)
+
+    x_vals = data_dict[net_names[0]].keys()
+    x_vals.sort()
+    print "x vals =", x_vals
+    n_vals = data_dict[ net_names[0] ][ x_vals[0] ].keys()
+    n_vals.sort()
+    print "n vals =", n_vals
+    x_size = len(x_vals)
+    n_size = len(n_vals)
+    num_nets = len(net_names)
+
+
+    # convert dict to ndarray
+
+    y_rel = np.zeros( (x_size, n_size, num_nets) )
+    for f, net in enumerate(net_names):
+        for xi, x in enumerate(x_vals):
+            for ni, n in enumerate(n_vals):
+                y = []
+                y_redux = []
+                r = []
+                for layer in data_dict[net][x][n]:
+                    cols = layer.split(',')
+                    y.append(       float(  cols[y_col]         ))
+                    y_redux.append( float(  cols[y_redux_col]   ))
+                    r.append(       int(    cols[total_row_col] ))
+                y = np.array(y)
+                y_redux = np.array(y_redux)
+                r = np.array(r)
+
+                # row reduction
+                y_rel [xi,ni,f] = y_redux.sum() / y.sum()
+
+                # stat per row
+                #y_redux [xi,ni,f] = y.sum() / r.sum() 
+
+                # weigh by number of rows
+                #y_rel [xi,ni,f] = np.sum( np.multiply(y,r) / r.sum() )
+    #    print net_names[f]
+    #    print y_rel [:,:,f]
 
 
 avg = y_rel.mean(2)
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# content addressed cache of model result rows
+#   key = sha1(filter csv contents, script version, script arguments)
+#   the script version hashes the script and the local modules it imports,
+#   so renaming a batch or moving the filters never forces a rerun but
+#   editing the model does
+#
+# usage: result_cache.py [-c cache_dir] <script> <csv> [args...]
+#   prints the cached rows for this run, or runs the script and caches its rows
+
+import sys
+import os
+import re
+import hashlib
+import tempfile
+import subprocess
+
+import instrument
+
+default_dir = ".result_cache"
+
+# sha1 of a file, memoized on (path, size, mtime)
+file_digests = {}
+def file_digest(path):
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime)
+    if (key not in file_digests):
+        h = hashlib.sha1()
+        f = open(path, 'rb')
+        for block in iter(lambda: f.read(1 << 20), ''):
+            h.update(block)
+        f.close()
+        file_digests[key] = h.hexdigest()
+    return file_digests[key]
+
+# modules in the script's directory imported by script, recursively
+def local_imports(script, found=None):
+    if (found is None):
+        found = [os.path.realpath(script)]
+    d = os.path.dirname(found[0])
+    for line in open(script):
+        m = re.match(r"\s*(?:import|from)\s+(\w+)", line)
+        if (not m):
+            continue
+        dep = os.path.join(d, m.group(1) + ".py")
+        if (os.path.exists(dep) and dep not in found):
+            found.append(dep)
+            local_imports(dep, found)
+    return found
+
+# hash of the code behind script's rows
+#   producers   other files that run the script's code (runner.py), their
+#               local imports are hashed too
+def script_version(script, producers=()):
+    files = set(local_imports(script))
+    for p in producers:
+        files.update(local_imports(p))
+    h = hashlib.sha1()
+    for f in sorted(files):
+        h.update(os.path.basename(f))
+        h.update(file_digest(f))
+    return h.hexdigest()
+
+def cache_key(script, csv, args, producers=()):
+    h = hashlib.sha1()
+    h.update(file_digest(csv))
+    h.update(script_version(script, producers))
+    h.update(repr(tuple(str(a) for a in args)))
+    return h.hexdigest()
+
+def cache_path(key, cache_dir=default_dir):
+    return os.path.join(cache_dir, key[:2], key)
+
+# cached rows for this run with csv as their first column, or None
+# rows are stored without the csv so a moved filter file still hits, a run
+# that prints several rows (ranges or lists of args) gets csv on each one
+def get(script, csv, args, cache_dir=default_dir, producers=()):
+    path = cache_path(cache_key(script, csv, args, producers), cache_dir)
+    if (not os.path.exists(path)):
+        return None
+    stored = open(path).read()
+    return "\n".join([csv + "," + line for line in stored.split("\n") if stored != ""])
+
+# caches the rows of this run, lines that are not result rows (blank or
+# without a csv column) are dropped
+def put(script, csv, args, row, cache_dir=default_dir, producers=()):
+    path = cache_path(cache_key(script, csv, args, producers), cache_dir)
+    if (not os.path.isdir(os.path.dirname(path))):
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass # created by another job
+    # write to a temp file and rename so concurrent jobs never see a partial row
+    (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path))
+    f = os.fdopen(fd, 'w')
+    f.write("\n".join([line.split(',', 1)[1] for line in row.split("\n") if ',' in line]))
+    f.close()
+    # mkstemp creates the file 0600, the cache is shared between jobs and
+    # users so give it the mode of any file created under the umask
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp, 0666 & ~umask)
+    os.rename(tmp, path)
+
+######### MAIN ################################################################
+
+def main():
+    args = sys.argv
+    me = args.pop(0)
+    cache_dir = default_dir
+    if (len(args) and args[0] == "-c"):
+        args.pop(0)
+        cache_dir = args.pop(0)
+    if (len(args) < 2):
+        print "usage: %s [-c cache_dir] <script> <csv> [args...]" % me
+        sys.exit(1)
+    script = args.pop(0)
+    csv = args.pop(0)
+
+    # instrumented runs are always measured, never read from the cache
+    row = None if instrument.enabled else get(script, csv, args, cache_dir)
+    if (row is None):
+        row = subprocess.check_output([sys.executable, script, csv] + args).strip()
+        put(script, csv, args, row, cache_dir)
+    print row
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/python
+# SQLite store for model results
+#   one record per (script, layer, config) with named parameter and result
+#   columns, indexed on the parameters so sweeps can be sliced without
+#   recomputing csv column offsets
+#
+# usage: results_db.py <db> <batch_dir> [<batch_dir>...]
+#   imports the results.csv of every run directory created by launch.pl
+
+import sys
+import os
+import re
+import glob
+import sqlite3
+import numpy as np
+
+# positional arguments of each script after the csv
+SCRIPT_ARGS = {
+    'bubble_up.py':         ('lookaside', 'lookahead', 'Tii'),
+    'bubble_up_rm_dup.py':  ('lookaside', 'lookahead', 'out_limit', 'in_limit', 'group_size',
+                             'out_b', 'buffer_size', 'n_sets', 'n_ways', 'Tii'),
+    'dup_analysis.py':      ('lookaside', 'lookahead', 'out_limit', 'in_limit',
+                             'buffer_size', 'n_sets', 'n_ways', 'Tii'),
+    'reuse_hist.py':        ('Tii',),
+    'row_stats.py':         ('Tii',),
+}
+
+# columns of the result row each script prints
+SCRIPT_COLUMNS = {
+    'bubble_up.py':         ('filename', 'lookaside', 'lookahead', 'total_reduced_rows', 'total_rows'),
+    'bubble_up_rm_dup.py':  ('filename', 'lookaside', 'lookahead', 'out_limit', 'in_limit', 'group_size',
+                             'out_b', 'zero_rm', 'dup_rm', 'total_dups', 'total_reduced_rows', 'total_rows'),
+    'dup_analysis.py':      ('filename', 'lookaside', 'lookahead', 'out_limit', 'in_limit', 'buffer_size',
+                             'n_sets', 'n_ways', 'Tii', 'forwarded_dups', 'removed_dups', 'total_dups'),
+}
+
+KEY_COLUMNS = ('batch', 'script', 'net', 'layer', 'precision')
+PARAM_COLUMNS = ('lookaside', 'lookahead', 'out_limit', 'in_limit', 'group_size',
+                 'out_b', 'buffer_size', 'n_sets', 'n_ways', 'Tii')
+RESULT_COLUMNS = ('zero_rm', 'dup_rm', 'total_dups', 'forwarded_dups', 'removed_dups',
+                  'total_reduced_rows', 'total_rows')
+COLUMNS = KEY_COLUMNS + PARAM_COLUMNS + RESULT_COLUMNS
+
+# reuse_hist.py rows go to their own table, one record per non empty bin
+HIST_SCRIPT = 'reuse_hist.py'
+HIST_COLUMNS = ('batch', 'net', 'layer', 'precision', 'Tii', 'bin', 'count')
+
+# row_stats.py rows go to their own table, one record per (layer, Tii)
+STATS_SCRIPT = 'row_stats.py'
+STATS_COLUMNS = ('batch', 'net', 'layer', 'precision', 'Tii', 'rows', 'zero_rows', 'min_rows', 'nonzeros')
+
+# opens (and creates) a result store
+def connect(path):
+    db = sqlite3.connect(path)
+    cols = ["%s TEXT" % c for c in KEY_COLUMNS] + \
+           ["%s INTEGER" % c for c in PARAM_COLUMNS + RESULT_COLUMNS]
+    db.execute("CREATE TABLE IF NOT EXISTS results (id INTEGER PRIMARY KEY, %s)" % ", ".join(cols))
+    db.execute("CREATE INDEX IF NOT EXISTS results_batch ON results (batch, script, net)")
+    for c in PARAM_COLUMNS:
+        db.execute("CREATE INDEX IF NOT EXISTS results_%s ON results (%s)" % (c, c))
+    db.execute("CREATE TABLE IF NOT EXISTS reuse_hist (id INTEGER PRIMARY KEY, batch TEXT, net TEXT, "
+               "layer TEXT, precision TEXT, Tii INTEGER, bin INTEGER, count INTEGER)")
+    db.execute("CREATE INDEX IF NOT EXISTS reuse_hist_batch ON reuse_hist (batch, net, Tii)")
+    db.execute("CREATE TABLE IF NOT EXISTS row_stats (id INTEGER PRIMARY KEY, batch TEXT, net TEXT, "
+               "layer TEXT, precision TEXT, Tii INTEGER, rows INTEGER, zero_rows INTEGER, "
+               "min_rows INTEGER, nonzeros INTEGER)")
+    db.execute("CREATE INDEX IF NOT EXISTS row_stats_batch ON row_stats (batch, net, Tii)")
+    return db
+
+# precision label of a batch, the suffix of its name: bubble_up_8bit -> 8bit
+def batch_precision(batch):
+    return batch.split('_')[-1]
+
+# layer name of a filter csv, net is the first net name it starts with
+def layer_name(csv, nets=()):
+    layer = re.sub(r"\.csv$", "", os.path.basename(csv))
+    for net in nets:
+        if (layer.startswith(net)):
+            return (net, layer)
+    return (layer, layer)
+
+# builds a record from one result row
+#   script  model script name
+#   args    the script arguments after the csv, values, ranges or lists
+#   row     the comma terminated line the script printed
+def make_record(script, args, row, batch='', precision='', nets=()):
+    script = os.path.basename(script)
+    values = [v.strip() for v in row.split(',')]
+    if (values[-1] == ''):
+        values.pop()
+
+    (net, layer) = layer_name(values[0], nets)
+    rec = dict(batch=batch, script=script, net=net, layer=layer, precision=precision)
+    for (name, value) in zip(SCRIPT_ARGS.get(script, ()), args):
+        # a range or list (0-15, 1,2,4) is replaced by the value the row
+        # printed below, it stays text if the row doesn't print it
+        try:
+            rec[name] = int(value)
+        except ValueError:
+            rec[name] = str(value)
+    for (name, value) in zip(SCRIPT_COLUMNS.get(script, ())[1:], values[1:]):
+        if (name in PARAM_COLUMNS or name in RESULT_COLUMNS):
+            rec[name] = int(float(value))
+    return rec
+
+def insert(db, records):
+    db.executemany("INSERT INTO results (%s) VALUES (%s)" % (", ".join(COLUMNS), ", ".join(["?"] * len(COLUMNS))),
+                   [ [rec.get(c) for c in COLUMNS] for rec in records ])
+    db.commit()
+
+# builds the histogram records from one reuse_hist.py row
+#   row     csv, Tii, reuses, bin 0, bin 1, ...
+def make_hist_records(row, batch='', precision='', nets=()):
+    values = [v.strip() for v in row.split(',')]
+    if (values[-1] == ''):
+        values.pop()
+
+    (net, layer) = layer_name(values[0], nets)
+    Tii = int(values[1])
+    return [ dict(batch=batch, net=net, layer=layer, precision=precision, Tii=Tii, bin=b, count=int(c))
+             for (b, c) in enumerate(values[3:]) if int(c) ]
+
+def insert_hist(db, records):
+    db.executemany("INSERT INTO reuse_hist (%s) VALUES (%s)" % (", ".join(HIST_COLUMNS), ", ".join(["?"] * len(HIST_COLUMNS))),
+                   [ [rec.get(c) for c in HIST_COLUMNS] for rec in records ])
+    db.commit()
+
+# builds the record of one row_stats.py row
+#   row     csv, Tii, rows, zero_rows, min_rows, nonzeros, lane densities
+def make_stats_record(row, batch='', precision='', nets=()):
+    values = [v.strip() for v in row.split(',')]
+    (net, layer) = layer_name(values[0], nets)
+    rec = dict(batch=batch, net=net, layer=layer, precision=precision)
+    for (name, value) in zip(STATS_COLUMNS[4:], values[1:]):
+        rec[name] = int(value)
+    return rec
+
+def insert_stats(db, records):
+    db.executemany("INSERT INTO row_stats (%s) VALUES (%s)" % (", ".join(STATS_COLUMNS), ", ".join(["?"] * len(STATS_COLUMNS))),
+                   [ [rec.get(c) for c in STATS_COLUMNS] for rec in records ])
+    db.commit()
+
+# stores the rows script printed for configs, in the table for that script
+def insert_rows(db, script, configs, rows, batch='', precision='', nets=()):
+    script = os.path.basename(script)
+    if (script == HIST_SCRIPT):
+        records = []
+        for row in rows:
+            records += make_hist_records(row, batch, precision, nets)
+        insert_hist(db, records)
+    elif (script == STATS_SCRIPT):
+        insert_stats(db, [ make_stats_record(row, batch, precision, nets) for row in rows ])
+    else:
+        insert(db, [ make_record(script, config, row, batch, precision, nets)
+                     for (config, row) in zip(configs, rows) ])
+    return len(rows)
+
+# selects columns of the records matching where (column=value)
+# returns a dict of column name -> ndarray
+def select(db, columns, **where):
+    for c in list(columns) + where.keys():
+        if (c not in COLUMNS):
+            raise ValueError("unknown column %s" % c)
+    sql = "SELECT %s FROM results" % ", ".join(columns)
+    if (where):
+        sql += " WHERE " + " AND ".join(["%s = ?" % c for c in where.keys()])
+    rows = db.execute(sql + " ORDER BY id", where.values()).fetchall()
+    return dict( (c, np.array([r[k] for r in rows])) for (k, c) in enumerate(columns) )
+
+# reuse distance histogram summed over the layers matching where (column=value)
+#   e.g. select_hist(db, batch='reuse_high', net='alexnet', Tii=1024)
+#   np.cumsum(counts) / counts.sum() is the fraction of reuses a buffer that
+#   holds products for 2^(bin+1) cycles can forward
+# returns counts[bin]
+def select_hist(db, **where):
+    for c in where.keys():
+        if (c not in HIST_COLUMNS):
+            raise ValueError("unknown column %s" % c)
+    sql = "SELECT bin, SUM(count) FROM reuse_hist"
+    if (where):
+        sql += " WHERE " + " AND ".join(["%s = ?" % c for c in where.keys()])
+    rows = db.execute(sql + " GROUP BY bin", where.values()).fetchall()
+    counts = np.zeros(max([b for (b, c) in rows] + [-1]) + 1, dtype=np.int64)
+    for (b, c) in rows:
+        counts[b] = c
+    return counts
+
+# selects columns of the row_stats records matching where (column=value)
+#   e.g. the baseline zero rows and the lower bound of every alexnet layer:
+#   select_stats(db, ['layer', 'zero_rows', 'min_rows', 'rows'], net='alexnet', Tii=1024)
+# returns a dict of column name -> ndarray
+def select_stats(db, columns, **where):
+    for c in list(columns) + where.keys():
+        if (c not in STATS_COLUMNS):
+            raise ValueError("unknown column %s" % c)
+    sql = "SELECT %s FROM row_stats" % ", ".join(columns)
+    if (where):
+        sql += " WHERE " + " AND ".join(["%s = ?" % c for c in where.keys()])
+    rows = db.execute(sql + " ORDER BY id", where.values()).fetchall()
+    return dict( (c, np.array([r[k] for r in rows])) for (k, c) in enumerate(columns) )
+
+# fraction of rows left in each net from the row_stats of the layers
+# matching where (column=value), summed over the layers of each net
+#   no_zero     with only the zero rows skipped (no lookahead)
+#   bound       the min_rows lower bound of any lookaside and lookahead
+# returns (nets, no_zero[net], bound[net])
+def stats_ratios(db, **where):
+    for c in where.keys():
+        if (c not in STATS_COLUMNS):
+            raise ValueError("unknown column %s" % c)
+    sql = "SELECT net, SUM(rows), SUM(zero_rows), SUM(min_rows) FROM row_stats"
+    if (where):
+        sql += " WHERE " + " AND ".join(["%s = ?" % c for c in where.keys()])
+    rows = db.execute(sql + " GROUP BY net ORDER BY net", where.values()).fetchall()
+    nets = [r[0] for r in rows]
+    no_zero = np.array([float(r[1] - r[2]) / r[1] for r in rows])
+    bound = np.array([float(r[3]) / r[1] for r in rows])
+    return (nets, no_zero, bound)
+
+# sum(y_redux) / sum(y) over the layers of each net for every (x, n) pair
+#   x, n    parameter columns, None to not split on it
+# returns (x_vals, n_vals, nets, y_rel[x, n, net])
+def ratio_table(db, x, n, y_redux, y, **where):
+    for c in [x, n, y_redux, y] + where.keys():
+        if (c is not None and c not in COLUMNS):
+            raise ValueError("unknown column %s" % c)
+    xs = x or "0"
+    ns = n or "0"
+    sql = "SELECT %s, %s, net, SUM(%s), SUM(%s) FROM results" % (xs, ns, y_redux, y)
+    if (where):
+        sql += " WHERE " + " AND ".join(["%s = ?" % c for c in where.keys()])
+    sql += " GROUP BY " + ", ".join([c for c in (x, n) if c is not None] + ["net"])
+    rows = db.execute(sql, where.values()).fetchall()
+
+    x_vals = sorted(set(r[0] for r in rows))
+    n_vals = sorted(set(r[1] for r in rows))
+    nets = sorted(set(r[2] for r in rows))
+    y_rel = np.zeros( (len(x_vals), len(n_vals), len(nets)) )
+    for (xv, nv, net, sr, s) in rows:
+        y_rel[x_vals.index(xv), n_vals.index(nv), nets.index(net)] = float(sr) / s
+    return (x_vals, n_vals, nets, y_rel)
+
+# imports results/<batch>/<script>-<config>/<layer>/results.csv from launch.pl
+def import_batch(db, batch_dir, nets=()):
+    batch = os.path.basename(os.path.normpath(batch_dir))
+    precision = batch_precision(batch)
+    n = 0
+    for run_dir in sorted(glob.glob(os.path.join(batch_dir, "*", "*"))):
+        results = os.path.join(run_dir, "results.csv")
+        if (not os.path.exists(results)):
+            continue
+        script = os.path.basename(os.readlink(os.path.join(run_dir, "script")))
+        args = open(os.path.join(run_dir, "args")).read().split()
+        rows = [line for line in open(results) if line.strip() != ""]
+        n += insert_rows(db, script, [args] * len(rows), rows, batch, precision, nets)
+    return n
+
+######### MAIN ################################################################
+
+def main():
+    args = sys.argv
+    script = args.pop(0)
+    if (len(args) < 2):
+        print "usage: %s <db> <batch_dir> [<batch_dir>...]" % script
+        sys.exit(1)
+    db = connect(args.pop(0))
+    nets = [l.strip() for l in open('net_names.txt') if l.strip() != ""]
+    for batch_dir in args:
+        print batch_dir, import_batch(db, batch_dir, nets)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/python
+# reuse distance histogram of the duplicate products of one layer
+#   a distance is the number of cycles (chunk.n_i_to_cycle) between two
+#   consecutive duplicates of a (weight, i), how long the product has to stay
+#   in the buffer to be reused. bin k counts the distances in [2^k, 2^(k+1))
+#   duplicates in the same cycle are forwarded and not counted
+
+import sys
+import numpy as np
+
+import read_filters
+import chunk
+import find_dups
+import bubble_up
+
+negatives_are_dups = True
+
+Ti=16
+Tn=16
+Tnn=1024
+
+# number of bins, every distance of a layer fits in 32 bits
+hist_bins = 32
+
+# returns counts[bin] of the reuse distances of dups with this Tii
+def reuse_hist(dups, Nn, Ni, Tii):
+    cycle_table = chunk.cycle_table(Nn,Ni,Tnn,Tii,Tn,Ti)
+    dist = find_dups.reuse_distances(dups, cycle_table, Ti)
+    bins = np.floor(np.log2(dist)).astype(np.intp)
+    return np.bincount(bins, minlength=hist_bins)
+
+# the result row of one Tii
+def format_row(filename, Tii, counts):
+    cols = (filename, Tii, counts.sum()) + tuple(counts)
+    return ", ".join([str(c) for c in cols]) + ","
+
+######### MAIN ################################################################
+
+# usage: reuse_hist.py <csv> <Tii>
+#   Tii can be a range or a list (64,256,1024), every Tii is evaluated on a
+#   single read of the csv, one result row per Tii:
+#   csv, Tii, reuses, bin 0, ..., bin 31,
+def main():
+    args = sys.argv
+    script      = args.pop(0)
+    filename    = args.pop(0)
+    Tiis        = bubble_up.parse_list(args.pop(0))
+
+    # w is an Nn x Ni ndarray of fixed point weight codes, weights = w * scale
+    (w, scale) = read_filters.read_codes(filename)
+    (Nn, Ni) = w.shape
+
+    dups = find_dups.DupGroups(w, negatives_are_dups)
+    for Tii in Tiis:
+        print format_row(filename, Tii, reuse_hist(dups, Nn, Ni, Tii))
+
+if __name__ == "__main__":
+    main()
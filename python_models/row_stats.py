@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# zero row and density statistics of one layer
+#   the nonzero counts of every (chunk, row, n) of the tiled layer are
+#   computed once, every statistic is read off them instead of checking
+#   each row with is_zero
+#
+#   zero_rows   rows with no nonzero weight, skipped even without lookahead
+#   min_rows    lower bound on the rows left for any lookahead and lookaside
+#               (without duplicate removal): weights never leave their
+#               filter lane n and a row takes at most Ti weights per lane,
+#               so a chunk needs ceil(nonzeros / Ti) rows for its fullest lane
+#   density     nonzero fraction of each filter lane n over all rows, lanes
+#               past the end of the layer count as zeros
+
+import sys
+import numpy as np
+
+import read_filters
+import chunk
+import bubble_up
+
+Ti=16
+Tn=16
+Tnn=1024
+
+# nonzero counts of every row of every chunk in the layer
+# returns:
+#   counts  num_chunks x R x Tn, rows past the end of a chunk are zero
+#   rows    number of rows in each chunk
+def layer_counts(w,Nn,Ni,Tnn,Tii,Tn,Ti):
+    (chunk_idx, chunk_rows) = chunk.chunk_schedule(Nn,Ni,Tnn,Tii,Tn,Ti)
+    counts = np.zeros((len(chunk_rows), max(chunk_rows), Tn), dtype=np.uint8) # at most Ti
+    for (c, (weights, c_idx)) in enumerate(chunk.iter_chunks(w,Nn,Ni,Tnn,Tii,Tn,Ti,reuse=True)):
+        counts[c,:weights.shape[0]] = (weights != 0).sum(axis=2)
+    return (counts, np.array(chunk_rows))
+
+# statistics of a layer from its counts
+# returns a dict of
+#   rows, zero_rows, min_rows, nonzeros     totals over all chunks
+#   row_counts      num_chunks x R nonzeros of each row
+#   density         Tn nonzero fractions, one per filter lane
+def row_stats(counts, rows, Ti):
+    row_counts = counts.sum(axis=2, dtype=np.int64)
+    valid = np.arange(counts.shape[1])[None,:] < rows[:,None]
+    lane_counts = counts.sum(axis=1, dtype=np.int64)
+    min_rows = ( (lane_counts.max(axis=1) + Ti-1) / Ti ).sum()
+    return dict(rows=int(rows.sum()),
+                zero_rows=int( (valid & (row_counts == 0)).sum() ),
+                min_rows=int(min_rows),
+                nonzeros=int(row_counts.sum()),
+                row_counts=row_counts,
+                density=lane_counts.sum(axis=0) / float(rows.sum() * Ti))
+
+# the result row of one Tii
+def format_row(filename, Tii, stats):
+    cols = (filename, Tii) + tuple(stats[s] for s in ('rows', 'zero_rows', 'min_rows', 'nonzeros'))
+    cols += tuple("%.4f" % d for d in stats['density'])
+    return ", ".join([str(c) for c in cols]) + ","
+
+######### MAIN ################################################################
+
+# usage: row_stats.py <csv> <Tii>
+#   Tii can be a range or a list (64,256,1024), every Tii is evaluated on a
+#   single read of the csv, one result row per Tii:
+#   csv, Tii, rows, zero_rows, min_rows, nonzeros, density lane 0, ..., lane 15,
+def main():
+    args = sys.argv
+    script      = args.pop(0)
+    filename    = args.pop(0)
+    Tiis        = bubble_up.parse_list(args.pop(0))
+
+    # w is an Nn x Ni ndarray of fixed point weight codes, weights = w * scale
+    (w, scale) = read_filters.read_codes(filename)
+    (Nn, Ni) = w.shape
+
+    for Tii in Tiis:
+        (counts, rows) = layer_counts(w,Nn,Ni,Tnn,Tii,Tn,Ti)
+        print format_row(filename, Tii, row_stats(counts, rows, Ti))
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,12 @@
 
 source /localhome/juddpatr/caffe_rc
 
+# uncomment to write the phase times and counters of every row to results.json
+#export INSTRUMENT=results.json
+
 time for file in `cat filters.txt`; do
-    /localhome/juddpatr/myroot/usr/bin/python script $file `cat args` >> results.csv
+    # results are cached by filter contents, model version and args across batches
+    /localhome/juddpatr/myroot/usr/bin/python result_cache.py -c ../../../.result_cache script $file `cat args` >> results.csv
     if [[ $? != 0 ]]; then
         >&2 echo "script returned non zero" 
         exit
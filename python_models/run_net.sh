@@ -20,16 +20,11 @@ do
     if [ -d $csv ]; then
         continue
     fi
-    for lah in {1..5}
-    do
-        for las in {0..15}
-        do
-            #echo "python bubble_up.py $csv $las $lah"
-            python bubble_up.py $csv $las $lah >> $outfile
-            if [[ $? != 0 ]]; then
-                # error or ctrl-c
-                exit
-            fi
-        done
-    done
+    # every lookaside 0..15 x lookahead 1..5 from one read of the csv
+    #echo "python bubble_up.py $csv 0-15 1-5"
+    python bubble_up.py $csv 0-15 1-5 >> $outfile
+    if [[ $? != 0 ]]; then
+        # error or ctrl-c
+        exit
+    fi
 done
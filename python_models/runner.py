@@ -0,0 +1,212 @@
+#!/usr/bin/python
+# runs a model script over every layer of a list of networks and a grid of
+# configurations on a pool of worker processes
+#
+# usage: runner.py [-j jobs] [-n nets.txt] [-o results.csv] [-d results.db] [-b batch]
+#                  [-c cache_dir] [-s script] <filter_dir> <arg> [<arg>...]
+#   each <arg> is one positional argument of the script after the csv, given
+#   as a value (3), a range (0-15) or a list (1,2,4); every combination is run
+#   e.g. runner.py -s bubble_up.py filters/csv_8bits 0-15 1-5
+#
+# work items are (layer, config) pairs so wall time scales with the number
+# of cores rather than with the largest network. layers are parsed once up
+# front into read_filters' .npy cache and workers memory map them.
+# rows already in the result_cache are not recomputed.
+
+import sys
+import os
+import glob
+import itertools
+import subprocess
+import multiprocessing
+from optparse import OptionParser
+
+import read_filters
+import bubble_up
+import bubble_up_rm_dup
+import reuse_hist
+import row_stats
+import find_dups
+import results_db
+import result_cache
+
+# layer csvs for each entry of a nets.txt style list
+def find_layers(filter_dir, nets):
+    layers = []
+    for net in nets:
+        for csv in sorted(glob.glob(os.path.join(filter_dir, net + "*.csv"))):
+            if (csv not in layers):
+                layers.append(csv)
+    return layers
+
+# cartesian product of the per-position value lists, first position slowest
+def config_grid(args):
+    return list(itertools.product(*[bubble_up.parse_list(a) for a in args]))
+
+def prepare_layer(csv):
+    read_filters.read_filters(csv)
+    return csv
+
+# per worker state is only kept for the last layer it ran, items come in
+# layer order so the next layer clears it instead of every layer a worker
+# has seen staying in memory until it exits
+def last_layer(cache, csv, build):
+    if (csv not in cache):
+        cache.clear()
+        cache[csv] = build()
+    return cache[csv]
+
+# bubble_up runs in process, masks are built once per layer and Tii per worker
+layer_masks = {}
+def run_bubble_up(csv, config):
+    lookaside, lookahead = config[0], config[1]
+    Tii = config[2] if len(config) > 2 else 1024
+    masks_of = last_layer(layer_masks, csv, dict)
+    if (Tii not in masks_of):
+        (w, scale) = read_filters.read_codes(csv)
+        (Nn, Ni) = w.shape
+        masks_of[Tii] = bubble_up.layer_masks(w,Nn,Ni,1024,Tii,16,16)
+    (masks, rows) = masks_of[Tii]
+    (row,) = bubble_up.sweep(masks, rows, [lookaside], [lookahead])
+    cols = (csv,) + row
+    return ", ".join([str(c) for c in cols]) + ","
+
+# bubble_up_rm_dup runs in process, each worker keeps a DupRemovalSim for its
+# layer so the duplicate groups and tiles are built once for all configs, and
+# a config that an earlier run with other limits repeats exactly reuses it
+rm_dup_sims = {}
+def run_rm_dup(csv, config):
+    def build():
+        (w, scale) = read_filters.read_codes(csv)
+        return (w, bubble_up_rm_dup.DupRemovalSim())
+    (w, sim) = last_layer(rm_dup_sims, csv, build)
+    params = dict(zip(bubble_up_rm_dup.PARAMS, config))
+    return bubble_up_rm_dup.format_row(csv, params, sim.run_shared(w, params)).strip()
+
+# reuse_hist runs in process, duplicates are found once per layer per worker
+layer_dups = {}
+def run_reuse_hist(csv, config):
+    def build():
+        (w, scale) = read_filters.read_codes(csv)
+        return (w.shape, find_dups.DupGroups(w, reuse_hist.negatives_are_dups))
+    ((Nn, Ni), dups) = last_layer(layer_dups, csv, build)
+    Tii = config[0]
+    return reuse_hist.format_row(csv, Tii, reuse_hist.reuse_hist(dups, Nn, Ni, Tii))
+
+# row_stats runs in process
+def run_row_stats(csv, config):
+    (w, scale) = read_filters.read_codes(csv)
+    (Nn, Ni) = w.shape
+    Tii = config[0]
+    (counts, rows) = row_stats.layer_counts(w,Nn,Ni,1024,Tii,16,16)
+    return row_stats.format_row(csv, Tii, row_stats.row_stats(counts, rows, 16))
+
+# other scripts still read their parameters from sys.argv
+def run_script(script, csv, config):
+    cmd = [sys.executable, script, csv] + [str(c) for c in config]
+    return subprocess.check_output(cmd).strip()
+
+# scripts run in process, the others run in a subprocess
+IN_PROCESS = {
+    'bubble_up.py':         run_bubble_up,
+    'bubble_up_rm_dup.py':  run_rm_dup,
+    'reuse_hist.py':        run_reuse_hist,
+    'row_stats.py':         run_row_stats,
+}
+
+def run_item(item):
+    (idx, script, csv, config) = item
+    run_in_process = IN_PROCESS.get(os.path.basename(script))
+    if (run_in_process):
+        return (idx, run_in_process(csv, config))
+    return (idx, run_script(script, csv, config))
+
+# code that produces the rows of script besides the script itself, the in
+# process scripts run through this file so it is part of their cache key
+runner_py = os.path.splitext(os.path.abspath(__file__))[0] + ".py"
+def producers(script):
+    if (os.path.basename(script) in IN_PROCESS):
+        return (runner_py,)
+    return ()
+
+# runs script on every layer and config, returns the result rows in
+# layer then config order
+#   cache_dir   result_cache directory, None to always run
+def run(script, layers, grid, jobs=None, cache_dir=None):
+    work = list(itertools.product(layers, grid))
+    rows = [None] * len(work)
+
+    # only run the points that are not cached
+    items = []
+    for (idx, (csv, config)) in enumerate(work):
+        if (cache_dir):
+            rows[idx] = result_cache.get(script, csv, config, cache_dir, producers(script))
+        if (rows[idx] is None):
+            items.append( (idx, script, csv, config) )
+    if (not items):
+        return rows
+
+    pool = multiprocessing.Pool(jobs or multiprocessing.cpu_count())
+    try:
+        # parse each layer once so every worker can memory map it
+        pool.map(prepare_layer, sorted(set(item[2] for item in items)))
+
+        for (idx, row) in pool.imap_unordered(run_item, items):
+            rows[idx] = row
+            if (cache_dir):
+                (csv, config) = work[idx]
+                result_cache.put(script, csv, config, row, cache_dir, producers(script))
+    finally:
+        pool.terminate()
+        pool.join()
+    return rows
+
+######### MAIN ################################################################
+
+def main():
+    parser = OptionParser(usage="%prog [options] <filter_dir> <arg> [<arg>...]")
+    parser.add_option("-j", dest="jobs", type="int", default=None,
+                      help="worker processes (default: number of cores)")
+    parser.add_option("-n", dest="nets", default="nets.txt",
+                      help="list of layer name prefixes (default: nets.txt)")
+    parser.add_option("-o", dest="out", default=None,
+                      help="append result rows here (default: stdout)")
+    parser.add_option("-d", dest="db", default=None,
+                      help="also store the results in this results_db file")
+    parser.add_option("-b", dest="batch", default="",
+                      help="batch name of the stored results")
+    parser.add_option("-p", dest="precision", default=None,
+                      help="precision of the stored results (default: from the batch name, as results_db.py)")
+    parser.add_option("-c", dest="cache_dir", default=result_cache.default_dir,
+                      help="result cache directory (default: %s)" % result_cache.default_dir)
+    parser.add_option("-C", dest="no_cache", action="store_true", default=False,
+                      help="don't use the result cache")
+    parser.add_option("-s", dest="script", default="bubble_up.py",
+                      help="model script (default: bubble_up.py)")
+    (opts, args) = parser.parse_args()
+    if (len(args) < 2):
+        parser.error("provide a filter directory and the script arguments")
+
+    filter_dir = args.pop(0)
+    nets = [l.strip() for l in open(opts.nets) if l.strip() != ""]
+    layers = find_layers(filter_dir, nets)
+    grid = config_grid(args)
+
+    cache_dir = None if opts.no_cache else opts.cache_dir
+    rows = run(opts.script, layers, grid, opts.jobs, cache_dir)
+
+    out = open(opts.out, "a") if opts.out else sys.stdout
+    for row in rows:
+        out.write(row + "\n")
+
+    if (opts.db):
+        precision = opts.precision or results_db.batch_precision(opts.batch)
+        net_names = []
+        if (os.path.exists("net_names.txt")):
+            net_names = [l.strip() for l in open("net_names.txt") if l.strip() != ""]
+        configs = [config for (csv, config) in itertools.product(layers, grid)]
+        db = results_db.connect(opts.db)
+        results_db.insert_rows(db, opts.script, configs, rows, opts.batch, precision, net_names)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+#!/usr/bin/python
+# checks of the models on the sample layers and small seeded ones, against
+# reference implementations where a model claims to match one
+#
+# usage: python -m unittest test_models   (from python_models)
+
+import os
+import math
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+import numpy as np
+
+import read_filters
+import result_cache
+import results_db
+import chunk
+import bubble_up
+import find_dups
+import opt_stack
+import look_for_replacement
+import bubble_up_rm_dup
+
+me = os.path.dirname(os.path.abspath(__file__))
+sample_dir = os.path.join(me, "..", "sample_code", "input")
+sample_csvs = [ os.path.join(sample_dir, f) for f in sorted(os.listdir(sample_dir)) if f.endswith(".csv") ]
+
+Ti=16
+Tn=16
+
+# Nn x Ni int8 codes, laplacian like trained weights pruned to density
+def seeded_layer(Nn, Ni, density, seed):
+    rs = np.random.RandomState(seed)
+    codes = np.clip(np.round(rs.laplace(0, 12, (Nn, Ni))), -127, 127).astype(np.int8)
+    codes[rs.rand(Nn, Ni) >= density] = 0
+    return codes
+
+# layer shapes and tilings: (Nn, Ni, Tnn, Tii), the ragged ones have partial
+# blocks of n and i and Tii that is not a multiple of Ti
+TILINGS = ( (64, 256, 32, 64), (40, 200, 32, 64), (48, 230, 1024, 40), (20, 100, 16, 1024) )
+
+# chunk as it was, one weight at a time
+def ref_chunk(weights,Nn,Ni,Tnn,Tii,Tn,Ti):
+    chunks = []
+    chunk_idx = []
+    for nnn in range(0, Nn, Tnn):
+        for iii in range(0, Ni, Tii):
+            for nn in range(nnn, min(nnn+Tnn,Nn), Tn):
+                rows = int( math.ceil( float(min(Tii, Ni-iii)) / Ti ) )
+                c = np.zeros((rows, Tn, Ti), dtype=weights.dtype)
+                for ii in range(iii, min(iii+Tii,Ni), Ti):
+                    r = (ii-iii)/Ti
+                    for n in range(nn, min(nn+Tn,Nn)):
+                        for i in range(ii, min(ii+Ti,Ni)):
+                            c[r,n-nn,i-ii] = weights[n,i]
+                chunks.append(c)
+                chunk_idx.append((nn,iii))
+    return (chunks, chunk_idx)
+
+class ChunkTest(unittest.TestCase):
+
+    # tile, chunk and iter_chunks build the chunks of the per weight loop
+    def test_chunks(self):
+        for (seed, (Nn, Ni, Tnn, Tii)) in enumerate(TILINGS):
+            w = seeded_layer(Nn, Ni, 0.5, seed)
+            (ref, ref_idx) = ref_chunk(w,Nn,Ni,Tnn,Tii,Tn,Ti)
+
+            (chunks, chunk_idx) = chunk.chunk(w,Nn,Ni,Tnn,Tii,Tn,Ti)
+            self.assertEqual(chunk_idx, ref_idx)
+            for (c, r) in zip(chunks, ref):
+                self.assertEqual(c.dtype, w.dtype)
+                self.assertTrue(np.array_equal(c, r))
+
+            (tiles, chunk_idx, chunk_rows) = chunk.tile(w,Nn,Ni,Tnn,Tii,Tn,Ti)
+            self.assertEqual(chunk_rows, [len(r) for r in ref])
+            for (c, r) in enumerate(ref):
+                self.assertFalse(tiles[c,len(r):].any())
+
+            for reuse in (False, True):
+                got = [ (c.copy(), c_idx) for (c, c_idx) in chunk.iter_chunks(w,Nn,Ni,Tnn,Tii,Tn,Ti,reuse=reuse) ]
+                self.assertEqual([c_idx for (c, c_idx) in got], ref_idx)
+                for ((c, c_idx), r) in zip(got, ref):
+                    self.assertTrue(np.array_equal(c, r))
+
+    # cycle_table holds n_i_to_cycle of every weight
+    def test_cycle_table(self):
+        for (Nn, Ni, Tnn, Tii) in TILINGS:
+            table = chunk.cycle_table(Nn,Ni,Tnn,Tii,Tn,Ti)
+            for n in range(Nn):
+                for i in range(0, Ni, Ti):
+                    self.assertEqual(table[n, i/Ti], chunk.n_i_to_cycle(n,i,Nn,Ni,Tnn,Tii,Tn,Ti))
+
+class OriginIndexTest(unittest.TestCase):
+
+    # the packed codes give the (r,n,i) the old np.indices array held, after
+    # weights move over (-1) and duplicates are removed (-2) too
+    def test_round_trip(self):
+        rs = np.random.RandomState(0)
+        for R in (3, 128, 129):
+            ind = chunk.origin_index(R,Tn,Ti)
+            self.assertEqual(ind.dtype, np.int16 if R <= 128 else np.int32)
+            ref = np.indices((R,Tn,Ti)).transpose(1,2,3,0).copy()
+
+            for k in range(200):
+                (r, n, i) = (rs.randint(R-1), rs.randint(Tn), rs.randint(Ti))
+                if (rs.rand() < 0.2):
+                    ind[r,n,i] = -2
+                    ref[r,n,i] = -2
+                else:
+                    (rr, ri) = (rs.randint(r+1, R), rs.randint(Ti))
+                    look_for_replacement.replace(r, n, i, rr, ri, np.zeros((R,Tn,Ti)), ind)
+                    ref[r,n,i] = ref[rr,n,ri]
+                    ref[rr,n,i] = -1
+
+            for (r, n, i) in zip(*[a.ravel() for a in np.indices((R,Tn,Ti))]):
+                self.assertEqual(chunk.origin(ind, r, n, i), tuple(ref[r,n,i]))
+                self.assertEqual(chunk.at_origin(ind, r, n, i), (ref[r,n,i] == (r,n,i)).all())
+
+class BubbleUpTest(unittest.TestCase):
+
+    # the bitmask engine, its lookaside = 0 closed form and sweep leave as
+    # many rows in every chunk as the loop engine process_weights
+    def test_engines(self):
+        (Nn, Ni, Tnn, Tii) = (40, 300, 1024, 128)
+        lookasides = [0, 1, 2, 5]
+        lookaheads = [1, 2, 4]
+        for (seed, density) in enumerate((0.15, 0.5)):
+            w = seeded_layer(Nn, Ni, density, seed)
+            (chunks, chunk_idx) = chunk.chunk(w,Nn,Ni,Tnn,Tii,Tn,Ti)
+            (masks, rows) = bubble_up.layer_masks(w,Nn,Ni,Tnn,Tii,Tn,Ti)
+
+            closed_form = bubble_up.fill_bubbles_lookahead(masks, rows, lookaheads)
+            swept = bubble_up.sweep(masks, rows, lookasides, lookaheads)
+            for (l, lookahead) in enumerate(lookaheads):
+                for lookaside in lookasides:
+                    ref = [ bubble_up.process_weights(c.copy(), lookaside, lookahead)[0] for c in chunks ]
+                    got = bubble_up.fill_bubbles(masks.copy(), rows, lookaside, lookahead)
+                    self.assertEqual(list(got), ref, (density, lookaside, lookahead))
+                    if (lookaside == 0):
+                        self.assertEqual(list(closed_form[l]), ref, (density, lookahead))
+                    self.assertIn( (lookaside, lookahead, sum(ref), int(rows.sum())), swept )
+
+# duplicates as build_dups found them, (value,i) -> ns in processing order
+def ref_dups(w, absolute,Tnn,Tii):
+    (Nn, Ni) = w.shape
+    dups = {}
+    for nnn in range(0, Nn, Tnn):
+        for iii in range(0, Ni, Tii):
+            for nn in range(nnn, min(nnn+Tnn,Nn), Tn):
+                for ii in range(iii, min(iii+Tii,Ni), Ti):
+                    for n in range(nn, min(nn+Tn,Nn)):
+                        for i in range(ii, min(ii+Ti,Ni)):
+                            weight = abs(w[n,i]) if absolute else w[n,i]
+                            if (weight != 0):
+                                dups.setdefault((weight,i), []).append(n)
+    return dict( (k, ns) for (k, ns) in dups.items() if len(ns) > 1 )
+
+class FindDupsTest(unittest.TestCase):
+
+    # the groups, in blocks of inputs too, are the ones build_dups found
+    #   with Tii not a multiple of Ti build_dups visited the inputs past Tii
+    #   in the last row twice, so only aligned tilings are compared
+    def test_groups(self):
+        block_weights = find_dups.block_weights
+        try:
+            for (seed, (Nn, Ni, Tnn, Tii)) in enumerate(TILINGS):
+                if (Tii % Ti):
+                    continue
+                w = seeded_layer(Nn, Ni, 0.4, seed)
+                for absolute in (True, False):
+                    ref = ref_dups(w, absolute,Tnn,Tii)
+                    for block in (block_weights, 7*Nn):
+                        find_dups.block_weights = block
+                        dups = find_dups.DupGroups(w, absolute)
+                        self.assertEqual(len(dups), len(ref))
+                        self.assertEqual(dups.total_dups(), sum([len(ns)-1 for ns in ref.values()]))
+                        got = {}
+                        for g in range(len(dups)):
+                            (v, i) = (dups.values[g], dups.inputs[g])
+                            got[(v,i)] = list(dups.ns[dups.offsets[g]:dups.offsets[g+1]])
+                            self.assertEqual(dups.group(v, i), g)
+                            self.assertEqual(dups.index(g, got[(v,i)][-1]), dups.offsets[g+1]-1)
+                        self.assertEqual(got, ref)
+                        self.assertEqual(dups.group(0, 0), -1)
+        finally:
+            find_dups.block_weights = block_weights
+
+# model parameters of the rm_dup checks, Tii is set per layer
+RM_DUP_PARAMS = dict(lookaside=3, lookahead=4, out_limit=4, in_limit=4, group_size=16, out_b=2,
+                     buffer_size=64, n_sets=1, n_ways=1)
+
+class LaneCountsTest(unittest.TestCase):
+
+    # f() with and without the LaneCounts of each chunk, without them every
+    # row of a lookahead window is probed
+    def with_and_without_counts(self, f):
+        lane_counts = look_for_replacement.LaneCounts
+        try:
+            look_for_replacement.LaneCounts = lambda weights: None
+            without = f()
+        finally:
+            look_for_replacement.LaneCounts = lane_counts
+        return (f(), without)
+
+    # process_weights moves the same weights
+    def test_process_weights(self):
+        (Nn, Ni, Tnn, Tii) = (40, 300, 1024, 128)
+        w = seeded_layer(Nn, Ni, 0.2, 0)
+        (chunks, chunk_idx) = chunk.chunk(w,Nn,Ni,Tnn,Tii,Tn,Ti)
+        for (lookaside, lookahead) in ((0, 1), (1, 2), (5, 4), (15, 8)):
+            run = lambda: [ bubble_up.process_weights(c.copy(), lookaside, lookahead) for c in chunks ]
+            (got, ref) = self.with_and_without_counts(run)
+            for ((rows, ind, weights), (ref_rows, ref_ind, ref_weights)) in zip(got, ref):
+                self.assertEqual(rows, ref_rows)
+                self.assertTrue(np.array_equal(ind, ref_ind))
+                self.assertTrue(np.array_equal(weights, ref_weights))
+
+    # bubble_up_rm_dup, where removed duplicates leave zeros the counts
+    # still hold, gives the same stats
+    def test_rm_dup(self):
+        w = seeded_layer(48, 256, 0.3, 1)
+        for (lookaside, lookahead) in ((1, 2), (5, 4)):
+            params = dict(RM_DUP_PARAMS, lookaside=lookaside, lookahead=lookahead, Tii=64)
+            (got, ref) = self.with_and_without_counts(lambda: bubble_up_rm_dup.DupRemovalSim().run(w, params))
+            self.assertEqual(got, ref)
+
+class RunLimitsTest(unittest.TestCase):
+
+    # a run_limits sweep, sharing runs between limits that make the same
+    # decisions, gives the stats of a separate run of every pair
+    def test_shared_runs(self):
+        w = seeded_layer(32, 256, 0.3, 2)
+        params = dict(RM_DUP_PARAMS, Tii=64)
+        limits = [ (out_limit, in_limit) for out_limit in (1, 2, 16) for in_limit in (16, 1, 4) ] + [(2, 1)]
+
+        sim = bubble_up_rm_dup.DupRemovalSim()
+        got = sim.run_limits(w, params, limits)
+        runs = sum([len(r) for r in sim.limit_runs.values()])
+        self.assertTrue(runs < len(set(limits)))
+
+        for ((out_limit, in_limit), stats) in zip(limits, got):
+            ref = bubble_up_rm_dup.DupRemovalSim().run(w, dict(params, out_limit=out_limit, in_limit=in_limit))
+            stats.pop('profile', None)
+            self.assertEqual(stats, ref, (out_limit, in_limit))
+
+# hits of an OPT cache of size entries that bypasses, one reference at a time
+#   a miss evicts the entry with the latest next reference, unless the new
+#   entry is reused later than that
+def ref_opt_hits(keys, next_ref, size):
+    cache = {} # key -> next reference
+    hits = []
+    for (x, nu) in zip(keys, next_ref):
+        hits.append(x in cache)
+        if (x not in cache and len(cache) == size):
+            victim = max(cache, key=lambda k: cache[k])
+            if (cache[victim] <= nu):
+                continue
+            del cache[victim]
+        cache[x] = nu
+    return np.array(hits)
+
+class OptStackTest(unittest.TestCase):
+
+    # a reference at stack distance d hits in every OPT cache of d or more
+    # entries and misses in the smaller ones
+    def test_stack_distances(self):
+        rs = np.random.RandomState(0)
+        depth = 12
+        for (n_keys, n_refs) in ((5, 50), (30, 400), (200, 400)):
+            keys = rs.zipf(1.5, n_refs) % n_keys
+            next_ref = opt_stack.next_refs(keys)
+            dist = opt_stack.stack_distances(keys, next_ref, depth)
+            for size in range(1, depth+1):
+                hits = ref_opt_hits(keys.tolist(), next_ref.tolist(), size)
+                self.assertTrue(np.array_equal(hits, (dist >= 1) & (dist <= size)), (n_keys, size))
+
+class ReadCodesTest(unittest.TestCase):
+
+    # the sample layers are printed with 6 decimals, they still read as codes
+    def test_sample_codes(self):
+        for csv in sample_csvs:
+            weights = read_filters.read_filters(csv, cache=False)
+            (codes, scale) = read_filters.read_codes(csv, cache=False)
+            self.assertIn(codes.dtype, (np.int8, np.int16), csv)
+            self.assertTrue(np.abs(codes * scale - weights).max() <= 1.0001 * read_filters.print_precision, csv)
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    # a range run prints several rows, they hit under another path with that
+    # path on every row
+    def test_moved_range(self):
+        cache_dir = os.path.join(self.tmp, "cache")
+        script = os.path.join(me, "bubble_up.py")
+        args = ["0-2", "1-2"]
+        a = os.path.join(self.tmp, "a.csv")
+        b = os.path.join(self.tmp, "b.csv")
+        shutil.copy(sample_csvs[0], a)
+        shutil.copy(sample_csvs[0], b)
+
+        cmd = [sys.executable, os.path.join(me, "result_cache.py"), "-c", cache_dir, script, a] + args
+        rows_a = subprocess.check_output(cmd).strip().split("\n")
+        rows_b = result_cache.get(script, b, args, cache_dir)
+
+        self.assertEqual(len(rows_a), 6)
+        self.assertIsNotNone(rows_b)
+        self.assertEqual(rows_b.split("\n"), [b + row[len(a):] for row in rows_a])
+
+    # blank or comma free lines are not cached, entries are readable by
+    # other users of the cache under the umask
+    def test_put(self):
+        cache_dir = os.path.join(self.tmp, "cache")
+        script = os.path.join(me, "bubble_up.py")
+        csv = sample_csvs[0]
+        result_cache.put(script, csv, ["1"], csv + ", 1, 2,\n\nnot a row", cache_dir)
+        self.assertEqual(result_cache.get(script, csv, ["1"], cache_dir), csv + ", 1, 2,")
+
+        umask = os.umask(0)
+        os.umask(umask)
+        path = result_cache.cache_path(result_cache.cache_key(script, csv, ["1"]), cache_dir)
+        self.assertEqual(os.stat(path).st_mode & 0777, 0666 & ~umask)
+
+    # rows the runner computes in process depend on runner.py too
+    def test_producers(self):
+        script = os.path.join(me, "bubble_up.py")
+        self.assertNotEqual(result_cache.cache_key(script, sample_csvs[0], ["1"]),
+                            result_cache.cache_key(script, sample_csvs[0], ["1"], (os.path.join(me, "runner.py"),)))
+
+class ResultsDbTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    # a runner sweep stored with -d reads back through read_results.py
+    def test_runner_round_trip(self):
+        filters = os.path.join(self.tmp, "filters")
+        os.mkdir(filters)
+        for (k, csv) in enumerate(sample_csvs):
+            shutil.copy(csv, os.path.join(filters, "net%d_conv.csv" % k))
+        open(os.path.join(self.tmp, "nets.txt"), 'w').write("net\n")
+        db_file = os.path.join(self.tmp, "results.db")
+        out = os.path.join(self.tmp, "results.csv")
+
+        subprocess.check_call([sys.executable, os.path.join(me, "runner.py"), "-C", "-j", "2", "-n", "nets.txt",
+                               "-o", out, "-d", db_file, "-b", "bubble_up_8bit", filters, "0-2", "1-2"], cwd=self.tmp)
+        report = subprocess.check_output([sys.executable, os.path.join(me, "read_results.py"), db_file, "bubble_up_8bit",
+                                          "lookaside", "lookahead", "total_reduced_rows", "total_rows"], cwd=self.tmp)
+
+        # the same reduction from the rows the runner printed
+        y_rel = np.zeros((3, 2, len(sample_csvs)))
+        for line in open(out):
+            (csv, lookaside, lookahead, reduced, total) = [c.strip() for c in line.split(',')[:5]]
+            k = int(os.path.basename(csv)[3])
+            y_rel[int(lookaside), int(lookahead)-1, k] = float(reduced) / int(total)
+        self.assertIn(np.array2string(y_rel.mean(2), precision=4), report)
+
+        db = results_db.connect(db_file)
+        stored = results_db.select(db, ['precision', 'lookaside'], batch='bubble_up_8bit')
+        self.assertEqual(len(stored['lookaside']), 6 * len(sample_csvs))
+        self.assertEqual(set(stored['precision']), set(["8bit"]))
+
+if __name__ == "__main__":
+    unittest.main()